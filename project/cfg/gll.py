@@ -4,6 +4,7 @@ from typing import Dict, Set, Tuple
 from pyformlang.finite_automaton import Symbol, DeterministicFiniteAutomaton
 from pyformlang import rsa
 import networkx as nx
+from project.regex.pruning import pruned_query, rsm_alphabet
 
 
 def gll_based_cfpq(
@@ -11,7 +12,13 @@ def gll_based_cfpq(
     graph: nx.DiGraph,
     start_nodes: Set[int] | None = None,
     final_nodes: Set[int] | None = None,
+    prune: bool = False,
 ) -> Set[Tuple[int, int]]:
+    if prune:
+        return pruned_query(
+            gll_based_cfpq, rsm, rsm_alphabet(rsm), graph, start_nodes, final_nodes
+        )
+
     if (start_nodes is None) or (start_nodes == set()):
         start_nodes = set(graph.nodes())
     if (final_nodes is None) or (final_nodes == set()):
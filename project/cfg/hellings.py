@@ -3,6 +3,7 @@ import networkx as nx
 from pyformlang.cfg import CFG, Terminal
 
 from project.cfg.wcnf import cfg_to_weak_normal_form
+from project.regex.pruning import cfg_alphabet, pruned_query
 
 
 def hellings_based_cfpq(
@@ -10,7 +11,13 @@ def hellings_based_cfpq(
     graph: nx.DiGraph,
     start_nodes: set[int] = None,
     final_nodes: set[int] = None,
+    prune: bool = False,
 ) -> set[tuple[int, int]]:
+    if prune:
+        return pruned_query(
+            hellings_based_cfpq, cfg, cfg_alphabet(cfg), graph, start_nodes, final_nodes
+        )
+
     wcnf = cfg_to_weak_normal_form(cfg)
 
     trip_set = set(
@@ -1,9 +1,11 @@
 import networkx as nx
 
-from pyformlang.cfg import CFG, Terminal
+from pyformlang.cfg import CFG
 from project.cfg.wcnf import cfg_to_weak_normal_form
 from collections import defaultdict
-from scipy.sparse import lil_matrix
+from scipy.sparse import csr_matrix, identity
+from project.regex.create_finite_automaton import graph_matrices
+from project.regex.pruning import cfg_alphabet, pruned_query
 
 
 def matrix_based_cfpq(
@@ -11,7 +13,13 @@ def matrix_based_cfpq(
     graph: nx.DiGraph,
     start_nodes: set[int] = None,
     final_nodes: set[int] = None,
+    prune: bool = False,
 ) -> set[tuple[int, int]]:
+    if prune:
+        return pruned_query(
+            matrix_based_cfpq, cfg, cfg_alphabet(cfg), graph, start_nodes, final_nodes
+        )
+
     wcnf = cfg_to_weak_normal_form(cfg)
     eps_prods = set()
     term_prods = defaultdict(set)
@@ -26,23 +34,27 @@ def matrix_based_cfpq(
             non_term_prods[production.head].add(
                 (production.body[0], production.body[1])
             )
-    nodes = list(graph.nodes)
+    # Terminal matrices are the label matrices of the cached graph matrices
+    cached = graph_matrices(graph)
+    nodes = cached.automaton.states
     indexes_nodes = {node: i for i, node in enumerate(nodes)}
-    numer_of_nodes = graph.number_of_nodes()
+    numer_of_nodes = len(nodes)
 
     matrices = {
-        var: lil_matrix((numer_of_nodes, numer_of_nodes), dtype=bool)
+        var: csr_matrix((numer_of_nodes, numer_of_nodes), dtype=bool)
         for var in wcnf.variables
     }
 
-    for i in range(numer_of_nodes):
-        for var in eps_prods:
-            matrices[var][i, i] = True
+    for var in eps_prods:
+        matrices[var] = matrices[var] + identity(
+            numer_of_nodes, dtype=bool, format="csr"
+        )
 
-    for u, v, label in graph.edges(data="label"):
-        i, j = indexes_nodes[u], indexes_nodes[v]
-        for var, vars in term_prods.items():
-            matrices[var][i, j] |= Terminal(label) in vars
+    for var, terminals in term_prods.items():
+        for terminal in terminals:
+            matrix = cached.edge_matrices.get(terminal.value)
+            if matrix is not None:
+                matrices[var] = matrices[var] + matrix
 
     while True:
         old_nnz = sum([v.nnz for v in matrices.values()])
@@ -1,11 +1,12 @@
 import networkx as nx
+import numpy as np
 
 from pyformlang.rsa import RecursiveAutomaton
 from project.regex.adjacency_matrix_fa import AdjacencyMatrixFA, intersect_automata
-from scipy.sparse import csc_matrix
-from pyformlang.finite_automaton import Symbol, State
-from project.regex.create_finite_automaton import graph_to_nfa
+from scipy.sparse import coo_matrix
+from project.regex.create_finite_automaton import graph_to_matrix_fa
 from project.cfg.rsm import rsm_to_nfa
+from project.regex.pruning import pruned_query, rsm_alphabet
 
 
 def tensor_based_cfpq(
@@ -13,62 +14,70 @@ def tensor_based_cfpq(
     graph: nx.DiGraph,
     start_nodes: set[int] = None,
     final_nodes: set[int] = None,
+    prune: bool = False,
 ) -> set[tuple[int, int]]:
+    if prune:
+        return pruned_query(
+            tensor_based_cfpq, rsm, rsm_alphabet(rsm), graph, start_nodes, final_nodes
+        )
+
     rsm_matrix = AdjacencyMatrixFA(rsm_to_nfa(rsm))
 
-    graph_matrix = AdjacencyMatrixFA(
-        graph_to_nfa(nx.MultiDiGraph(graph), start_nodes, final_nodes)
+    graph_matrix = graph_to_matrix_fa(graph, start_nodes, final_nodes)
+
+    # RSM states are (nonterminal, box state) pairs
+    nonterms = list({value[0] for value in rsm_matrix.states})
+    state_nonterm = np.array(
+        [nonterms.index(value[0]) for value in rsm_matrix.states], dtype=np.int64
     )
+    rsm_start = rsm_matrix.start_mask()
+    rsm_final = rsm_matrix.final_mask()
+    number_of_rsm_states = rsm_matrix.number_of_states
+    number_of_nodes = graph_matrix.number_of_states
 
     while True:
         transitive_closure = intersect_automata(
             graph_matrix, rsm_matrix
         ).transitive_сlosure()
-        delta: dict[Symbol, csc_matrix] = {}
 
-        for i, j in zip(*transitive_closure.nonzero()):
-            rsm_i = i % rsm_matrix.number_of_states
-            rsm_j = j % rsm_matrix.number_of_states
-            st1, st2 = rsm_matrix.id_state[rsm_i], rsm_matrix.id_state[rsm_j]
+        rows, cols = transitive_closure.nonzero()
+        graph_i, rsm_i = np.divmod(rows, number_of_rsm_states)
+        graph_j, rsm_j = np.divmod(cols, number_of_rsm_states)
+        box_path = rsm_start[rsm_i] & rsm_final[rsm_j]
+        assert (state_nonterm[rsm_i[box_path]] == state_nonterm[rsm_j[box_path]]).all()
 
-            if st1 in rsm_matrix.start_states and st2 in rsm_matrix.final_states:
-                assert st1.value[0] == st2.value[0]
-                nonterm = st1.value[0]
-                graph_i, graph_j = (
-                    i // rsm_matrix.number_of_states,
-                    j // rsm_matrix.number_of_states,
-                )
-                if (
-                    nonterm in graph_matrix.decomposition
-                    and graph_matrix.decomposition[nonterm][graph_i, graph_j]
-                ):
-                    continue
-                if nonterm not in delta:
-                    delta[nonterm] = csc_matrix(
-                        (graph_matrix.number_of_states, graph_matrix.number_of_states),
-                        dtype=bool,
-                    )
-                delta[nonterm][graph_i, graph_j] = True
+        changed = False
+        for k, nonterm in enumerate(nonterms):
+            found = box_path & (state_nonterm[rsm_i] == k)
+            if not found.any():
+                continue
 
-        if not delta:
-            break
+            paths = coo_matrix(
+                (np.ones(found.sum(), dtype=bool), (graph_i[found], graph_j[found])),
+                shape=(number_of_nodes, number_of_nodes),
+            ).tocsr()
+            known = graph_matrix.matrix(nonterm)
+            if known is None:
+                graph_matrix.set_symbol_matrix(nonterm, paths)
+                changed = True
+            elif (paths > known).nnz > 0:
+                graph_matrix.set_symbol_matrix(nonterm, known + paths)
+                changed = True
 
-        for symbol in delta.keys():
-            if symbol not in graph_matrix.decomposition:
-                graph_matrix.decomposition[symbol] = delta[symbol]
-            else:
-                graph_matrix.decomposition[symbol] += delta[symbol]
+        if not changed:
+            break
 
-    start_matrix = graph_matrix.decomposition.get(rsm.initial_label)
+    start_matrix = graph_matrix.matrix(rsm.initial_label)
 
     if start_matrix is None:
         return set()
 
+    start_matrix = start_matrix.tocoo()
+    start_mask = graph_matrix.start_mask()
+    final_mask = graph_matrix.final_mask()
+    found = start_mask[start_matrix.row] & final_mask[start_matrix.col]
+
     return {
-        (start, final)
-        for start in start_nodes
-        for final in final_nodes
-        if start_matrix[
-            graph_matrix.state_id[State(start)], graph_matrix.state_id[State(final)]
-        ]
+        (graph_matrix.states[start], graph_matrix.states[final])
+        for start, final in zip(start_matrix.row[found], start_matrix.col[found])
     }
@@ -1,123 +1,700 @@
-import itertools
+import os
+
 import numpy as np
-from typing import Iterable
+from types import MappingProxyType
+from typing import Iterable, Mapping
 from pyformlang.finite_automaton import Symbol, State
 from pyformlang.finite_automaton import NondeterministicFiniteAutomaton
-from scipy.sparse import csc_matrix, kron
+from scipy.sparse import coo_matrix, csr_matrix, kron
+
+from project.regex.bit_matrix import WORD_BITS, BitMatrix, to_backend
+from project.regex.closure import (
+    insert_closure_edge,
+    is_reachable,
+    recompute_closure_rows,
+    transitive_closure,
+)
+
+
+# Building the boolean decomposition from (state, symbol, state) triples:
+# transitions are collected into integer arrays in one pass, then every
+# per-symbol matrix is produced with a single COO -> CSR conversion
+def build_decomposition(
+    transitions: Iterable[tuple[State, Symbol, State]],
+    state_id: dict[State, int],
+    number_of_states: int,
+) -> dict[Symbol, csr_matrix]:
+    symbol_id: dict[Symbol, int] = {}
+    rows, cols, labels = [], [], []
+
+    for from_st, symbol, to_st in transitions:
+        rows.append(state_id[from_st])
+        cols.append(state_id[to_st])
+        labels.append(symbol_id.setdefault(symbol, len(symbol_id)))
+
+    matrices = label_matrices(
+        np.asarray(rows, dtype=np.int64),
+        np.asarray(labels, dtype=np.int64),
+        np.asarray(cols, dtype=np.int64),
+        len(symbol_id),
+        number_of_states,
+    )
+
+    return dict(zip(symbol_id, matrices))
+
+
+# Per-label matrices from (row, label, col) arrays: edges are grouped by
+# label with one stable sort
+def label_matrices(
+    rows: np.ndarray,
+    labels: np.ndarray,
+    cols: np.ndarray,
+    number_of_labels: int,
+    number_of_states: int,
+) -> list[csr_matrix]:
+    order = np.argsort(labels, kind="stable")
+    bounds = np.searchsorted(labels[order], np.arange(number_of_labels + 1))
+
+    matrices = []
+    for i in range(number_of_labels):
+        edges = order[bounds[i] : bounds[i + 1]]
+        matrices.append(
+            coo_matrix(
+                (np.ones(len(edges), dtype=bool), (rows[edges], cols[edges])),
+                shape=(number_of_states, number_of_states),
+            ).tocsr()
+        )
+
+    return matrices
+
+
+# Values as an array indexable by ids: int64 for integer values, otherwise
+# an object array
+def value_array(values: list) -> np.ndarray:
+    if all(
+        isinstance(value, (int, np.integer)) and not isinstance(value, bool)
+        for value in values
+    ):
+        return np.fromiter(values, dtype=np.int64, count=len(values))
+    return np.fromiter(values, dtype=object, count=len(values))
 
 
+def matrix_nbytes(matrix: csr_matrix | BitMatrix) -> int:
+    if isinstance(matrix, BitMatrix):
+        return matrix.words.nbytes
+    return matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+
+
+# Finite automaton as a boolean decomposition over dense integer state ids.
+# States are stored by value and symbols are interned into dense label ids:
+# the matrices are a list indexed by label id, and decomposition is only a
+# symbol-keyed view of that list. Pyformlang objects are created only when
+# state_id, id_state, start_states or final_states are requested.
+# Transitions can be added and removed in place: edits are buffered per
+# symbol and merged into the matrices when the decomposition is read next.
+# After maintain_closure() the reflexive transitive closure is kept up to
+# date on every edit as bit-packed rows
 class AdjacencyMatrixFA:
+    __slots__ = (
+        "number_of_states",
+        "states",
+        "start_ids",
+        "final_ids",
+        "symbols",
+        "symbol_id",
+        "_matrices",
+        "_state_id",
+        "_pending",
+        "_closure_words",
+        "_transposed",
+    )
+
     def __init__(self, automaton: NondeterministicFiniteAutomaton = None):
+        self.number_of_states: int = 0
+        self.states: list = []
+        self.start_ids: np.ndarray = np.zeros(0, dtype=np.int64)
+        self.final_ids: np.ndarray = np.zeros(0, dtype=np.int64)
+        self.symbols: list[Symbol] = []
+        self.symbol_id: dict[Symbol, int] = {}
+        self._matrices: list[csr_matrix] = []
+        self._state_id: dict | None = None
+        self._pending: dict[int, dict[int, dict[int, bool]]] = {}
+        self._closure_words: np.ndarray | None = None
+        self._transposed: list[tuple] = []
+
         if automaton is None:
-            self.number_of_states = 0
-            self.state_id = dict()
-            self.id_state = dict()
-            self.start_states = set()
-            self.start_states_id = dict()
-            self.final_states = set()
-            self.decomposition = dict()
             return
 
-        self.number_of_states = len(automaton.states)
-        self.state_id: dict[State, int] = {
-            st: i for i, st in enumerate(automaton.states)
-        }
-        self.id_state: dict[int, State] = {i: st for st, i in self.state_id.items()}
-        self.start_states: set[State] = automaton.start_states
-        self.start_states_id: dict[State, int] = {
-            st: i for i, st in enumerate(automaton.start_states)
-        }
-        self.final_states: set[State] = automaton.final_states
-        self.decomposition: dict[Symbol, csc_matrix] = {}
+        self.states = [st.value for st in automaton.states]
+        self.number_of_states = len(self.states)
+        self.start_ids = self._states_ids(automaton.start_states)
+        self.final_ids = self._states_ids(automaton.final_states)
+        self.decomposition = build_decomposition(
+            automaton, self.state_id, self.number_of_states
+        )
+
+    # Building from integer arrays without any pyformlang objects:
+    # states are 0..number_of_states-1 and labels index into symbols
+    @classmethod
+    def from_table(
+        cls,
+        number_of_states: int,
+        start_ids: Iterable[int],
+        final_ids: Iterable[int],
+        symbols: list[Symbol],
+        transitions: np.ndarray,
+    ) -> "AdjacencyMatrixFA":
+        fa = cls()
+        fa.number_of_states = number_of_states
+        fa.states = list(range(number_of_states))
+        fa.start_ids = np.unique(np.asarray(start_ids, dtype=np.int64))
+        fa.final_ids = np.unique(np.asarray(final_ids, dtype=np.int64))
+        transitions = np.asarray(transitions, dtype=np.int64).reshape(-1, 3)
+        fa.decomposition = dict(
+            zip(
+                symbols,
+                label_matrices(
+                    transitions[:, 0],
+                    transitions[:, 1],
+                    transitions[:, 2],
+                    len(symbols),
+                    number_of_states,
+                ),
+            )
+        )
+        return fa
+
+    # Persisting in the binary format of project.regex.fa_storage
+    def save(self, path: str | os.PathLike):
+        from project.regex.fa_storage import save_adjacency_matrix_fa
+
+        save_adjacency_matrix_fa(self, path)
+
+    @classmethod
+    def load(cls, path: str | os.PathLike, mmap: bool = True) -> "AdjacencyMatrixFA":
+        from project.regex.fa_storage import load_adjacency_matrix_fa
 
-        for state in self.state_id.keys():
-            id = self.state_id[state]
-            transitions: dict[Symbol, State | set[State]] = automaton.to_dict().get(
-                state
+        return load_adjacency_matrix_fa(path, mmap)
+
+    # New labels start with an empty matrix
+    def _intern_symbol(self, symbol: Symbol) -> int:
+        label = self.symbol_id.get(symbol)
+        if label is None:
+            label = len(self.symbols)
+            self.symbol_id[symbol] = label
+            self.symbols.append(symbol)
+            self._matrices.append(
+                csr_matrix((self.number_of_states, self.number_of_states), dtype=bool)
             )
-            if transitions is None:
+        return label
+
+    def set_symbol_matrix(self, symbol: Symbol, matrix: csr_matrix):
+        label = self._intern_symbol(symbol)
+        self._pending.pop(label, None)
+        self._matrices[label] = matrix
+        if self._closure_words is not None:
+            self.maintain_closure()
+
+    # Matrices indexed by label id. Reading them merges the buffered
+    # edits first
+    @property
+    def matrices(self) -> list[csr_matrix]:
+        if self._pending:
+            self._flush()
+        return self._matrices
+
+    # A read-only view built on every access, so writing to it raises
+    # TypeError. Matrices are changed by set_symbol_matrix, by transition
+    # edits or by assigning a whole new decomposition
+    @property
+    def decomposition(self) -> Mapping[Symbol, csr_matrix]:
+        return MappingProxyType(dict(zip(self.symbols, self.matrices)))
+
+    @decomposition.setter
+    def decomposition(self, decomposition: dict[Symbol, csr_matrix]):
+        self.symbols = list(decomposition)
+        self.symbol_id = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self._matrices = list(decomposition.values())
+
+    def matrix(self, symbol: Symbol) -> csr_matrix | None:
+        label = self.symbol_id.get(symbol)
+        return None if label is None else self.matrices[label]
+
+    # Transposed matrices as CSR, for walking transitions backwards. Each one
+    # is kept together with the matrix it was built from and rebuilt only
+    # when that matrix has been replaced. The list is updated in place, so
+    # copies made by with_start_final share it
+    def transposed_matrices(self) -> list[csr_matrix]:
+        previous = dict(enumerate(self._transposed))
+        pairs = []
+        for label, matrix in enumerate(self.matrices):
+            source, transposed = previous.get(label, (None, None))
+            if source is not matrix:
+                transposed = to_backend(matrix, "sparse").T.tocsr()
+            pairs.append((matrix, transposed))
+        self._transposed[:] = pairs
+        return [transposed for _, transposed in pairs]
+
+    # The same transitions with other start and final states. Matrices are
+    # shared: edits of either automaton replace matrices, never change them
+    def with_start_final(
+        self, start_ids: np.ndarray, final_ids: np.ndarray
+    ) -> "AdjacencyMatrixFA":
+        fa = AdjacencyMatrixFA()
+        fa.number_of_states = self.number_of_states
+        fa.states = list(self.states)
+        fa.start_ids = np.asarray(start_ids, dtype=np.int64)
+        fa.final_ids = np.asarray(final_ids, dtype=np.int64)
+        fa.decomposition = self.decomposition
+        fa._transposed = self._transposed
+        return fa
+
+    # Bytes held by the matrices and the cached transposes
+    def nbytes(self) -> int:
+        matrices = {id(matrix): matrix for matrix in self.matrices}
+        matrices.update((id(matrix), matrix) for _, matrix in self._transposed)
+        return sum(matrix_nbytes(matrix) for matrix in matrices.values())
+
+    # Pairs of label ids of the symbols shared with another automaton
+    def shared_labels(self, other: "AdjacencyMatrixFA") -> list[tuple[int, int]]:
+        return [
+            (label, other.symbol_id[symbol])
+            for label, symbol in enumerate(self.symbols)
+            if symbol in other.symbol_id
+        ]
+
+    def _flush(self):
+        shape = (self.number_of_states, self.number_of_states)
+
+        for label, matrix in enumerate(self._matrices):
+            delta = self._pending.get(label)
+            if matrix.shape == shape and not delta:
                 continue
-            for symbol in transitions.keys():
-                if symbol not in self.decomposition:
-                    self.decomposition[symbol] = csc_matrix(
-                        (self.number_of_states, self.number_of_states), dtype=bool
-                    )
-                if isinstance(transitions[symbol], Iterable):
-                    for to_st in transitions[symbol]:
-                        to_idx = self.state_id[to_st]
-                        self.decomposition[symbol][id, to_idx] = True
-                else:
-                    to_st: State = transitions[symbol]
-                    to_idx = self.state_id[to_st]
-                    self.decomposition[symbol][id, to_idx] = True
+
+            backend = "bitpacked" if isinstance(matrix, BitMatrix) else "sparse"
+            edges = to_backend(matrix, "sparse").tocoo()
+            rows, cols = edges.row.astype(np.int64), edges.col.astype(np.int64)
+
+            if delta:
+                changes = [
+                    (source, target, added)
+                    for source, targets in delta.items()
+                    for target, added in targets.items()
+                ]
+                sources, targets, added = (np.array(column) for column in zip(*changes))
+                added = added.astype(bool)
+                removed = sources[~added] * shape[0] + targets[~added]
+                kept = ~np.isin(rows * shape[0] + cols, removed)
+                rows = np.concatenate([rows[kept], sources[added]])
+                cols = np.concatenate([cols[kept], targets[added]])
+
+            self._matrices[label] = to_backend(
+                coo_matrix(
+                    (np.ones(len(rows), dtype=bool), (rows, cols)), shape=shape
+                ).tocsr(),
+                backend,
+            )
+
+        self._pending = {}
+
+    # Keyed by state values, which also finds pyformlang states:
+    # a State hashes and compares equal to its value
+    @property
+    def state_id(self) -> dict:
+        if self._state_id is None:
+            self._state_id = {value: i for i, value in enumerate(self.states)}
+        return self._state_id
+
+    # Built from the integer core on every access and read-only, so edits
+    # raise instead of being lost. Start and final states are changed
+    # through start_ids and final_ids
+    @property
+    def id_state(self) -> Mapping[int, State]:
+        return MappingProxyType(
+            {i: State(value) for i, value in enumerate(self.states)}
+        )
+
+    @property
+    def start_states(self) -> frozenset[State]:
+        return frozenset(State(self.states[i]) for i in self.start_ids)
+
+    @property
+    def final_states(self) -> frozenset[State]:
+        return frozenset(State(self.states[i]) for i in self.final_ids)
+
+    def _add_state(self, value) -> int:
+        id = self.number_of_states
+        self.states.append(value)
+        self.state_id[value] = id
+        self.number_of_states += 1
+
+        if self._closure_words is not None:
+            capacity, words = self._closure_words.shape
+            if id >= capacity or id >= words * WORD_BITS:
+                grown = np.zeros((2 * capacity + 1, 2 * words + 1), dtype=np.uint64)
+                grown[:capacity, :words] = self._closure_words
+                self._closure_words = grown
+            self._closure_words[id, id // WORD_BITS] |= np.uint64(1) << np.uint64(
+                id % WORD_BITS
+            )
+
+        return id
+
+    def _has_transition(self, source: int, label: int, target: int) -> bool:
+        targets = self._pending.get(label, {}).get(source, {})
+        if target in targets:
+            return targets[target]
+
+        matrix = self._matrices[label]
+        if max(source, target) >= matrix.shape[0]:
+            return False
+        return bool(matrix[source, target])
+
+    # Successor ids of a state over all symbols, buffered edits included
+    def _successors(self, source: int) -> set[int]:
+        successors = set()
+
+        for matrix in self._matrices:
+            if source >= matrix.shape[0]:
+                continue
+            if isinstance(matrix, BitMatrix):
+                successors.update(np.flatnonzero(matrix.row(source)).tolist())
+            else:
+                successors.update(
+                    matrix.indices[
+                        matrix.indptr[source] : matrix.indptr[source + 1]
+                    ].tolist()
+                )
+
+        removed = set()
+        for delta in self._pending.values():
+            for target, added in delta.get(source, {}).items():
+                (successors if added else removed).add(target)
+
+        return successors - {
+            target
+            for target in removed
+            if not any(
+                self._has_transition(source, label, target)
+                for label in range(len(self._matrices))
+            )
+        }
+
+    def _closure(self) -> BitMatrix:
+        return BitMatrix(
+            (self.number_of_states, self.number_of_states),
+            self._closure_words[: self.number_of_states],
+        )
+
+    # Returns False if the transition was already there
+    def add_transition(self, source, symbol, target) -> bool:
+        symbol = symbol if isinstance(symbol, Symbol) else Symbol(symbol)
+        source_id = self.state_id.get(source)
+        if source_id is None:
+            source_id = self._add_state(getattr(source, "value", source))
+        target_id = self.state_id.get(target)
+        if target_id is None:
+            target_id = self._add_state(getattr(target, "value", target))
+
+        label = self._intern_symbol(symbol)
+        if self._has_transition(source_id, label, target_id):
+            return False
+
+        self._pending.setdefault(label, {}).setdefault(source_id, {})[target_id] = True
+        if self._closure_words is not None:
+            insert_closure_edge(self._closure(), source_id, target_id)
+        return True
+
+    # Returns False if there was no such transition
+    def remove_transition(self, source, symbol, target) -> bool:
+        symbol = symbol if isinstance(symbol, Symbol) else Symbol(symbol)
+        label = self.symbol_id.get(symbol)
+        source_id = self.state_id.get(source)
+        target_id = self.state_id.get(target)
+        if (
+            label is None
+            or source_id is None
+            or target_id is None
+            or not self._has_transition(source_id, label, target_id)
+        ):
+            return False
+
+        self._pending.setdefault(label, {}).setdefault(source_id, {})[target_id] = False
+        if self._closure_words is not None and target_id not in self._successors(
+            source_id
+        ):
+            closure = self._closure()
+            recompute_closure_rows(
+                closure, np.flatnonzero(closure.column(source_id)), self._successors
+            )
+        return True
+
+    # Keeping the closure up to date on every edit from now on
+    def maintain_closure(self):
+        closure = transitive_closure(self.adjacency_matrix())
+        self._closure_words = BitMatrix.from_sparse(closure).words
+
+    def _states_ids(self, states: Iterable[State]) -> np.ndarray:
+        return np.array(sorted(self.state_id[st] for st in states), dtype=np.int64)
+
+    def _ids_mask(self, ids: np.ndarray) -> np.ndarray:
+        mask = np.zeros(self.number_of_states, dtype=bool)
+        mask[ids] = True
+        return mask
+
+    def start_mask(self) -> np.ndarray:
+        return self._ids_mask(self.start_ids)
+
+    def final_mask(self) -> np.ndarray:
+        return self._ids_mask(self.final_ids)
+
+    def state_values(self) -> np.ndarray:
+        return value_array(self.states)
+
+    # Distinct (start, final) pairs of state ids, sorted and mapped to state
+    # values in a single lookup. Callers mapping many answers can pass the
+    # state_values() array once
+    def state_pairs(
+        self,
+        start_ids: np.ndarray,
+        final_ids: np.ndarray,
+        values: np.ndarray = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        keys = np.unique(
+            np.asarray(start_ids, dtype=np.int64) * self.number_of_states
+            + np.asarray(final_ids, dtype=np.int64)
+        )
+        if values is None:
+            values = self.state_values()
+        return (
+            values[keys // self.number_of_states],
+            values[keys % self.number_of_states],
+        )
+
+    # One step of the simulation: the frontier is a boolean vector over
+    # state ids, so a letter costs a single vector x sparse matrix product
+    def _step(self, frontier: np.ndarray, letter: Symbol) -> np.ndarray | None:
+        matrix = self.matrix(letter)
+        if matrix is None:
+            return None
+        return frontier @ matrix
 
     def accepts(self, word: Iterable[Symbol]) -> bool:
-        states = set(self.start_states)
+        frontier = self.start_mask()
 
         for letter in word:
-            if self.decomposition.get(letter) is None:
+            frontier = self._step(frontier, letter)
+            if frontier is None or not frontier.any():
                 return False
 
-            for s1, s2 in itertools.product(states, self.state_id.keys()):
-                if self.decomposition[letter][self.state_id[s1], self.state_id[s2]]:
-                    states.add(s2)
+        return bool((frontier & self.final_mask()).any())
+
+    # Checking many words at once: the words are put into a prefix tree,
+    # so the frontier of a shared prefix is computed only once
+    def accepts_many(self, words: Iterable[Iterable[Symbol]]) -> list[bool]:
+        children: list[dict[Symbol, int]] = [{}]
+        endings: list[list[int]] = [[]]
+        number_of_words = 0
+
+        for word in words:
+            node = 0
+            for letter in word:
+                child = children[node].get(letter)
+                if child is None:
+                    child = len(children)
+                    children[node][letter] = child
+                    children.append({})
+                    endings.append([])
+                node = child
+            endings[node].append(number_of_words)
+            number_of_words += 1
+
+        result = [False] * number_of_words
+        final_vector = self.final_mask()
+        stack = [(0, self.start_mask())]
 
-        if states.intersection(self.final_states):
-            return True
+        while stack:
+            node, frontier = stack.pop()
+            if endings[node]:
+                accepted = bool((frontier & final_vector).any())
+                for i in endings[node]:
+                    result[i] = accepted
 
-        return False
+            for letter, child in children[node].items():
+                next_frontier = self._step(frontier, letter)
+                if next_frontier is not None and next_frontier.any():
+                    stack.append((child, next_frontier))
 
-    def transitive_сlosure(self) -> np.ndarray:
-        A = np.eye(self.number_of_states, dtype=bool)
+        return result
 
-        for dec in self.decomposition.values():
-            A |= dec.toarray()
+    # Storing the symbol matrices as scipy sparse matrices, bit-packed rows
+    # or choosing per matrix by its density ("auto")
+    def use_backend(self, backend: str):
+        self._matrices = [to_backend(matrix, backend) for matrix in self.matrices]
 
-        transitive_сlosure = np.linalg.matrix_power(A, self.number_of_states).astype(
-            bool
+    # Edges of all labels as (labels, rows, cols) arrays
+    def labeled_edges(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        matrices = [to_backend(matrix, "sparse").tocsr() for matrix in self.matrices]
+        labels = np.repeat(
+            np.arange(len(matrices), dtype=np.int64),
+            [matrix.nnz for matrix in matrices],
+        )
+        rows = np.concatenate(
+            [np.zeros(0, dtype=np.int64)]
+            + [
+                np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+                for matrix in matrices
+            ]
+        )
+        cols = np.concatenate(
+            [np.zeros(0, dtype=np.int64)] + [matrix.indices for matrix in matrices]
+        )
+        return labels, rows, cols
+
+    # Union of all symbol matrices in one COO -> CSR conversion,
+    # bit-packed if all of them are
+    def adjacency_matrix(self) -> csr_matrix | BitMatrix:
+        shape = (self.number_of_states, self.number_of_states)
+        matrices = self.matrices
+
+        if matrices and all(isinstance(dec, BitMatrix) for dec in matrices):
+            adjacency = BitMatrix(shape)
+            for dec in matrices:
+                adjacency = adjacency | dec
+            return adjacency
+
+        _, rows, cols = self.labeled_edges()
+        return coo_matrix(
+            (np.ones(len(rows), dtype=bool), (rows, cols)), shape=shape
+        ).tocsr()
+
+    # Out- and in-degrees of every state per label, as (labels, states) arrays
+    def degree_statistics(self) -> tuple[np.ndarray, np.ndarray]:
+        labels, rows, cols = self.labeled_edges()
+        size = len(self.symbols) * self.number_of_states
+        out_degrees = np.bincount(labels * self.number_of_states + rows, minlength=size)
+        in_degrees = np.bincount(labels * self.number_of_states + cols, minlength=size)
+        return (
+            out_degrees.reshape(len(self.symbols), self.number_of_states),
+            in_degrees.reshape(len(self.symbols), self.number_of_states),
         )
-        return transitive_сlosure
 
+    # The maintained closure is returned as is, whatever the strategy
+    def transitive_сlosure(self, strategy: str = "auto") -> csr_matrix:
+        if self._closure_words is not None:
+            return self._closure().tocsr()
+        return transitive_closure(self.adjacency_matrix(), strategy)
+
+    # The language is empty when no final state is reachable from a start
+    # state. The search runs from the smaller of the two sets
     def is_empty(self) -> bool:
-        transitive_сlosure = self.transitive_сlosure()
-        for start_state in self.start_states:
-            for final_state in self.final_states:
-                if transitive_сlosure[
-                    self.state_id[start_state], self.state_id[final_state]
-                ]:
-                    return False
+        start = self.start_mask()
+        final = self.final_mask()
+        backward = final.sum() < start.sum()
 
-        return True
+        if backward:
+            start, final = final, start
 
+        return not is_reachable(self.adjacency_matrix(), start, final, backward)
 
-def intersect_automata(
-    automaton1: AdjacencyMatrixFA, automaton2: AdjacencyMatrixFA
-) -> AdjacencyMatrixFA:
-    intersection_matrix = AdjacencyMatrixFA()
 
-    intersection_matrix.number_of_states = (
-        automaton1.number_of_states * automaton2.number_of_states
-    )
+# Product automaton of the tensor intersection. Only the operands and the
+# start and final index arrays are stored: the product state (i, j) has
+# id i * n2 + j, and the pyformlang states are created only on request
+class ProductAdjacencyMatrixFA(AdjacencyMatrixFA):
+    __slots__ = ("automaton1", "automaton2")
+
+    def __init__(
+        self,
+        automaton1: AdjacencyMatrixFA,
+        automaton2: AdjacencyMatrixFA,
+        backend: str = "sparse",
+    ):
+        self.automaton1 = automaton1
+        self.automaton2 = automaton2
+        self.number_of_states = (
+            automaton1.number_of_states * automaton2.number_of_states
+        )
+        self.start_ids = self._product_ids(automaton1.start_ids, automaton2.start_ids)
+        self.final_ids = self._product_ids(automaton1.final_ids, automaton2.final_ids)
+        matrices1, matrices2 = automaton1.matrices, automaton2.matrices
+        self.decomposition = {
+            automaton1.symbols[label1]: to_backend(
+                kron(
+                    to_backend(matrices1[label1], "sparse"),
+                    to_backend(matrices2[label2], "sparse"),
+                    format="csr",
+                ),
+                backend,
+            )
+            for label1, label2 in automaton1.shared_labels(automaton2)
+        }
+        self._state_id = None
+        self._pending = {}
+        self._closure_words = None
+        self._transposed = []
+
+    def product_id(self, id1: int | np.ndarray, id2: int | np.ndarray):
+        return id1 * self.automaton2.number_of_states + id2
+
+    def split_id(self, id: int | np.ndarray):
+        return divmod(id, self.automaton2.number_of_states)
+
+    def _product_ids(self, ids1: np.ndarray, ids2: np.ndarray) -> np.ndarray:
+        return self.product_id(ids1[:, None], ids2[None, :]).ravel()
+
+    def start_mask(self) -> np.ndarray:
+        return np.outer(
+            self.automaton1.start_mask(), self.automaton2.start_mask()
+        ).ravel()
+
+    def final_mask(self) -> np.ndarray:
+        return np.outer(
+            self.automaton1.final_mask(), self.automaton2.final_mask()
+        ).ravel()
 
-    for s1 in automaton1.state_id.keys():
-        for s2 in automaton2.state_id.keys():
-            id1, id2 = automaton1.state_id[s1], automaton2.state_id[s2]
-            intesection_id = id1 * automaton2.number_of_states + id2
-
-            intersection_matrix.state_id[State((s1, s2))] = intesection_id
-            if s1 in automaton1.start_states and s2 in automaton2.start_states:
-                intersection_matrix.start_states.add(State((s1, s2)))
-            if s1 in automaton1.final_states and s2 in automaton2.final_states:
-                intersection_matrix.final_states.add(State((s1, s2)))
-
-    intersection_matrix.decomposition = {
-        key: kron(
-            automaton1.decomposition[key],
-            automaton2.decomposition[key],
-            format="csr",
+    # Product state values are pairs of operand state values,
+    # they are only built when the state tables are requested
+    @property
+    def states(self) -> list:
+        return [
+            (value1, value2)
+            for value1 in self.automaton1.states
+            for value2 in self.automaton2.states
+        ]
+
+    # Single states are decoded from the operands, without the full list
+    def _state_values(self, ids: np.ndarray) -> list[tuple]:
+        states1, states2 = self.automaton1.states, self.automaton2.states
+        ids1, ids2 = self.split_id(np.asarray(ids, dtype=np.int64))
+        return [
+            (states1[id1], states2[id2])
+            for id1, id2 in zip(ids1.tolist(), ids2.tolist())
+        ]
+
+    @property
+    def id_state(self) -> Mapping[int, State]:
+        return MappingProxyType(
+            {
+                i: State(value)
+                for i, value in enumerate(
+                    self._state_values(np.arange(self.number_of_states))
+                )
+            }
         )
-        for key in automaton1.decomposition.keys()
-        if key in automaton2.decomposition
-    }
 
-    return intersection_matrix
+    @property
+    def start_states(self) -> frozenset[State]:
+        return frozenset(State(value) for value in self._state_values(self.start_ids))
+
+    @property
+    def final_states(self) -> frozenset[State]:
+        return frozenset(State(value) for value in self._state_values(self.final_ids))
+
+
+def intersect_automata(
+    automaton1: AdjacencyMatrixFA,
+    automaton2: AdjacencyMatrixFA,
+    backend: str = "sparse",
+) -> AdjacencyMatrixFA:
+    return ProductAdjacencyMatrixFA(automaton1, automaton2, backend)
@@ -0,0 +1,133 @@
+import networkx as nx
+import numpy as np
+from pyformlang.finite_automaton import Symbol
+
+from project.regex.adjacency_matrix_fa import AdjacencyMatrixFA
+from project.regex.create_finite_automaton import graph_to_matrix_fa
+from project.regex.glushkov import compile_regex
+from project.regex.reachability import (
+    block_regex_matrices,
+    final_pairs,
+    ms_bfs_visited,
+)
+from project.regex.regex_cache import CompiledRegex
+
+
+# Regexes over the same alphabet are evaluated together as one
+# disjoint-union automaton of at most this many states
+BATCH_MAX_STATES = 64
+
+
+# Disjoint union of compiled regexes over the given symbols: the states of
+# the i-th regex are shifted by the states of the ones before it. Returns
+# the automaton and the final state ids of every regex
+def disjoint_union(
+    compiled: list[CompiledRegex], symbols: list
+) -> tuple[AdjacencyMatrixFA, list[np.ndarray]]:
+    symbol_label = {symbol: i for i, symbol in enumerate(symbols)}
+    offsets = np.cumsum([0] + [regex.number_of_states for regex in compiled])
+
+    transitions, start_ids, final_ids = [], [], []
+    for regex, offset in zip(compiled, offsets.tolist()):
+        labels = np.array(
+            [symbol_label[symbol] for symbol in regex.symbols], dtype=np.int64
+        )
+        table = regex.transitions.astype(np.int64)
+        transitions.append(
+            np.column_stack(
+                [table[:, 0] + offset, labels[table[:, 1]], table[:, 2] + offset]
+            ).reshape(-1, 3)
+        )
+        if regex.start >= 0:
+            start_ids.append(regex.start + offset)
+        final_ids.append(regex.finals.astype(np.int64) + offset)
+
+    union = AdjacencyMatrixFA.from_table(
+        int(offsets[-1]),
+        start_ids,
+        np.concatenate(final_ids),
+        [Symbol(symbol) for symbol in symbols],
+        np.concatenate(transitions),
+    )
+    return union, final_ids
+
+
+# Indices of the regexes grouped by alphabet, every group split into
+# batches of at most max_states states in total
+def _batches(compiled: list[CompiledRegex], max_states: int) -> list[list[int]]:
+    groups: dict[frozenset, list[int]] = {}
+    for i, regex in enumerate(compiled):
+        groups.setdefault(frozenset(regex.symbols), []).append(i)
+
+    batches = []
+    for indices in groups.values():
+        batch, states = [], 0
+        for i in indices:
+            if batch and states + compiled[i].number_of_states > max_states:
+                batches.append(batch)
+                batch, states = [], 0
+            batch.append(i)
+            states += compiled[i].number_of_states
+        batches.append(batch)
+
+    return batches
+
+
+# The answers of many regexes over one graph, each as arrays of start and
+# final nodes. The graph automaton is built once, and every batch of
+# regexes is answered by a single ms-BFS sweep over its disjoint union
+def batch_rpq_arrays(
+    regexes: list[str],
+    graph: nx.MultiDiGraph,
+    start_nodes: set[int] = None,
+    final_nodes: set[int] = None,
+    regex_mode: str = "auto",
+    max_states: int = BATCH_MAX_STATES,
+) -> list[tuple[np.ndarray, np.ndarray]]:
+    graph_fa = graph_to_matrix_fa(graph, start_nodes, final_nodes)
+    values = graph_fa.state_values()
+    start_ids = graph_fa.start_ids
+    compiled = [compile_regex(regex, regex_mode) for regex in regexes]
+
+    answers = [None] * len(regexes)
+    for batch in _batches(compiled, max_states):
+        symbols = list(compiled[batch[0]].symbols)
+        union, final_ids = disjoint_union([compiled[i] for i in batch], symbols)
+        labels = union.shared_labels(graph_fa)
+        visited = ms_bfs_visited(
+            union,
+            graph_fa,
+            start_ids,
+            labels,
+            block_regex_matrices(union, len(start_ids), labels),
+        )
+
+        for i, regex_final_ids in zip(batch, final_ids):
+            answers[i] = graph_fa.state_pairs(
+                *final_pairs(
+                    visited,
+                    union.number_of_states,
+                    regex_final_ids,
+                    start_ids,
+                    graph_fa.final_ids,
+                ),
+                values=values,
+            )
+
+    return answers
+
+
+def batch_rpq(
+    regexes: list[str],
+    graph: nx.MultiDiGraph,
+    start_nodes: set[int] = None,
+    final_nodes: set[int] = None,
+    regex_mode: str = "auto",
+    max_states: int = BATCH_MAX_STATES,
+) -> list[set[tuple[int, int]]]:
+    return [
+        set(zip(starts.tolist(), finals.tolist()))
+        for starts, finals in batch_rpq_arrays(
+            regexes, graph, start_nodes, final_nodes, regex_mode, max_states
+        )
+    ]
@@ -0,0 +1,212 @@
+import numpy as np
+
+from scipy.sparse import csr_matrix, issparse
+
+
+WORD_BITS = 64
+
+# Matrices with at least this share of nonzero cells are stored bit-packed
+# by the "auto" backend
+BITPACKED_DENSITY = 0.01
+
+BACKENDS = ("sparse", "bitpacked", "auto")
+
+# Bits unpacked at once when the set bits of a matrix are listed
+UNPACK_BLOCK_BITS = 1 << 22
+
+
+def _number_of_words(number_of_bits: int) -> int:
+    return (number_of_bits + WORD_BITS - 1) // WORD_BITS
+
+
+def _popcount(words: np.ndarray) -> int:
+    if hasattr(np, "bitwise_count"):
+        return int(np.bitwise_count(words).sum())
+    return int(np.unpackbits(words.view(np.uint8)).sum())
+
+
+def _pack(dense: np.ndarray) -> np.ndarray:
+    rows, cols = dense.shape
+    packed = np.zeros((rows, _number_of_words(cols) * 8), dtype=np.uint8)
+    packed[:, : (cols + 7) // 8] = np.packbits(dense, axis=1, bitorder="little")
+    return packed.view(np.uint64)
+
+
+def _unpack(words: np.ndarray, number_of_bits: int) -> np.ndarray:
+    return np.unpackbits(
+        words.view(np.uint8), axis=-1, count=number_of_bits, bitorder="little"
+    ).astype(bool)
+
+
+# Set bits of packed rows as (first row of the block, row in the block,
+# column) arrays in row-major order, one block of rows unpacked at a time.
+# Only words with a bit set are unpacked
+def _set_bits(words: np.ndarray):
+    block_rows = max(1, UNPACK_BLOCK_BITS // max(words.shape[1] * WORD_BITS, 1))
+    for begin in range(0, words.shape[0], block_rows):
+        block = words[begin : begin + block_rows]
+        rows, word_ids = np.nonzero(block)
+        bits = np.unpackbits(
+            block[rows, word_ids].view(np.uint8).reshape(-1, 8),
+            axis=1,
+            bitorder="little",
+        )
+        positions, offsets = np.nonzero(bits)
+        yield (
+            begin,
+            rows[positions],
+            word_ids[positions] * WORD_BITS + offsets,
+        )
+
+
+def _or_bits(words: np.ndarray, rows: np.ndarray, cols: np.ndarray):
+    np.bitwise_or.at(
+        words,
+        (rows, cols // WORD_BITS),
+        np.left_shift(np.uint64(1), (cols % WORD_BITS).astype(np.uint64)),
+    )
+
+
+# Boolean matrix with every row packed into uint64 words, 8 times smaller
+# than a dense bool array. Products use the OR/AND semiring on whole words
+class BitMatrix:
+    __slots__ = ("shape", "words")
+
+    # Makes NumPy defer `vector @ matrix` to __rmatmul__
+    __array_ufunc__ = None
+
+    def __init__(self, shape: tuple[int, int], words: np.ndarray | None = None):
+        self.shape = (int(shape[0]), int(shape[1]))
+        if words is None:
+            words = np.zeros(
+                (self.shape[0], _number_of_words(self.shape[1])), dtype=np.uint64
+            )
+        self.words = words
+
+    @classmethod
+    def from_dense(cls, dense: np.ndarray) -> "BitMatrix":
+        dense = np.asarray(dense, dtype=bool)
+        return cls(dense.shape, _pack(dense))
+
+    @classmethod
+    def from_sparse(cls, matrix) -> "BitMatrix":
+        matrix = matrix.tocoo()
+        bits = cls(matrix.shape)
+        _or_bits(bits.words, matrix.row, matrix.col)
+        return bits
+
+    def toarray(self) -> np.ndarray:
+        return _unpack(self.words, self.shape[1])
+
+    # Built from the set bits without a dense array; columns come out sorted
+    def tocsr(self) -> csr_matrix:
+        index_dtype = np.int32 if max(*self.shape, self.nnz) < 2**31 else np.int64
+        counts = np.zeros(self.shape[0], dtype=np.int64)
+        cols = [np.zeros(0, dtype=index_dtype)]
+        for begin, rows, block_cols in _set_bits(self.words):
+            block_counts = np.bincount(rows)
+            counts[begin : begin + len(block_counts)] += block_counts
+            cols.append(block_cols.astype(index_dtype))
+
+        indptr = np.zeros(self.shape[0] + 1, dtype=index_dtype)
+        np.cumsum(counts, out=indptr[1:])
+        cols = np.concatenate(cols)
+        matrix = csr_matrix(
+            (np.ones(len(cols), dtype=bool), cols, indptr), shape=self.shape
+        )
+        matrix.has_sorted_indices = True
+        return matrix
+
+    @property
+    def nnz(self) -> int:
+        return _popcount(self.words)
+
+    @property
+    def T(self) -> "BitMatrix":
+        transposed = BitMatrix((self.shape[1], self.shape[0]))
+        for begin, rows, cols in _set_bits(self.words):
+            _or_bits(transposed.words, cols, begin + rows)
+        return transposed
+
+    def copy(self) -> "BitMatrix":
+        return BitMatrix(self.shape, self.words.copy())
+
+    def __getitem__(self, cell: tuple[int, int]) -> bool:
+        row, col = cell
+        word = self.words[row, col // WORD_BITS]
+        return bool((word >> np.uint64(col % WORD_BITS)) & np.uint64(1))
+
+    def row(self, row: int) -> np.ndarray:
+        return _unpack(self.words[row], self.shape[1])
+
+    def column(self, col: int) -> np.ndarray:
+        word = self.words[:, col // WORD_BITS]
+        return ((word >> np.uint64(col % WORD_BITS)) & np.uint64(1)).astype(bool)
+
+    def __or__(self, other: "BitMatrix") -> "BitMatrix":
+        return BitMatrix(self.shape, self.words | other.words)
+
+    __add__ = __or__
+
+    def __and__(self, other: "BitMatrix") -> "BitMatrix":
+        return BitMatrix(self.shape, self.words & other.words)
+
+    multiply = __and__
+
+    # Rows reached from a boolean vector over the rows: OR of the selected rows
+    def __rmatmul__(self, vector: np.ndarray) -> np.ndarray:
+        selected = self.words[np.asarray(vector, dtype=bool)]
+        return _unpack(np.bitwise_or.reduce(selected, axis=0), self.shape[1])
+
+    def __matmul__(self, other):
+        if isinstance(other, np.ndarray) and other.ndim == 1:
+            packed = _pack(np.asarray(other, dtype=bool)[None, :])[0]
+            return (self.words & packed).any(axis=1)
+
+        if issparse(other):
+            other = BitMatrix.from_sparse(other)
+
+        # OR/AND product: every row i with bit k set takes row k of the other
+        result = BitMatrix((self.shape[0], other.shape[1]))
+        for k in np.flatnonzero(other.words.any(axis=1)):
+            rows = self.column(k)
+            if rows.any():
+                result.words[rows] |= other.words[k]
+
+        return result
+
+    # Reflexive transitive closure by Warshall's algorithm on packed rows
+    def closure(self) -> "BitMatrix":
+        closure = self.copy()
+        diagonal = np.arange(min(self.shape))
+        closure.words[diagonal, diagonal // WORD_BITS] |= np.left_shift(
+            np.uint64(1), (diagonal % WORD_BITS).astype(np.uint64)
+        )
+        for k in range(self.shape[0]):
+            rows = closure.column(k)
+            closure.words[rows] |= closure.words[k]
+
+        return closure
+
+
+def density(matrix) -> float:
+    cells = matrix.shape[0] * matrix.shape[1]
+    return matrix.nnz / cells if cells else 0.0
+
+
+# Converting a decomposition matrix to the requested backend
+def to_backend(matrix, backend: str):
+    if backend not in BACKENDS:
+        raise ValueError(
+            f"Unknown matrix backend {backend!r}, expected one of {', '.join(BACKENDS)}"
+        )
+
+    if backend == "auto":
+        backend = "bitpacked" if density(matrix) >= BITPACKED_DENSITY else "sparse"
+
+    if backend == "bitpacked":
+        return (
+            matrix if isinstance(matrix, BitMatrix) else BitMatrix.from_sparse(matrix)
+        )
+
+    return matrix.tocsr() if isinstance(matrix, BitMatrix) else matrix
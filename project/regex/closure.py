@@ -0,0 +1,281 @@
+import numpy as np
+from typing import Callable, Iterable
+
+from scipy.sparse import coo_matrix, csr_matrix, identity
+from scipy.sparse.csgraph import connected_components
+
+from project.regex.bit_matrix import WORD_BITS, BitMatrix
+
+
+# Automata with at most this many states are closed with dense matrices
+DENSE_THRESHOLD = 64
+
+
+def _reflexive(adjacency: csr_matrix) -> csr_matrix:
+    number_of_states = adjacency.shape[0]
+    return (identity(number_of_states, dtype=bool, format="csr") + adjacency).tocsr()
+
+
+# Dense repeated squaring, stops as soon as the matrix stops changing
+def dense_closure(adjacency: csr_matrix) -> csr_matrix:
+    closure = _reflexive(adjacency).toarray()
+
+    while True:
+        next_closure = closure @ closure
+        if np.array_equal(next_closure, closure):
+            break
+        closure = next_closure
+
+    return csr_matrix(closure)
+
+
+# Sparse repeated squaring of I + A: the matrix only grows,
+# so an unchanged number of nonzeros means a fixpoint
+def squaring_closure(adjacency: csr_matrix) -> csr_matrix:
+    closure = _reflexive(adjacency)
+
+    while True:
+        next_closure = closure @ closure
+        if next_closure.nnz == closure.nnz:
+            break
+        closure = next_closure
+
+    return closure
+
+
+# Sparse BFS from all states at once: only the pairs found on the
+# previous level are expanded
+def bfs_closure(adjacency: csr_matrix) -> csr_matrix:
+    closure = _reflexive(adjacency)
+    front = closure
+
+    while front.nnz > 0:
+        reached = front @ adjacency
+        front = (reached > closure).tocsr()
+        closure = closure + front
+
+    return closure
+
+
+# Warshall's algorithm on bit-packed rows
+def bitpacked_closure(adjacency: csr_matrix) -> csr_matrix:
+    return BitMatrix.from_sparse(adjacency).closure().tocsr()
+
+
+# Kahn's algorithm on an acyclic graph
+def _topological_order(dag: csr_matrix) -> list[int]:
+    indptr, indices = dag.indptr, dag.indices
+    indegree = np.bincount(indices, minlength=dag.shape[0])
+    queue = list(np.flatnonzero(indegree == 0))
+    order = []
+    while queue:
+        node = queue.pop()
+        order.append(node)
+        for succ in indices[indptr[node] : indptr[node + 1]]:
+            indegree[succ] -= 1
+            if indegree[succ] == 0:
+                queue.append(succ)
+
+    return order
+
+
+def _condensation(
+    adjacency: csr_matrix,
+) -> tuple[int, np.ndarray, csr_matrix]:
+    number_of_components, labels = connected_components(
+        adjacency, directed=True, connection="strong"
+    )
+
+    edges = adjacency.tocoo()
+    from_comp, to_comp = labels[edges.row], labels[edges.col]
+    between = from_comp != to_comp
+    condensation = coo_matrix(
+        (np.ones(between.sum(), dtype=bool), (from_comp[between], to_comp[between])),
+        shape=(number_of_components, number_of_components),
+    ).tocsr()
+
+    return number_of_components, labels, condensation
+
+
+# Strongly connected components are collapsed first, every state of a
+# component reaches the same set of states. Reachability on the acyclic
+# condensation is propagated in reverse topological order with integer
+# bitsets, one bit per component
+def scc_closure(adjacency: csr_matrix) -> csr_matrix:
+    number_of_states = adjacency.shape[0]
+    number_of_components, labels, condensation = _condensation(adjacency)
+    indptr, indices = condensation.indptr, condensation.indices
+
+    order = _topological_order(condensation)
+
+    reach = [0] * number_of_components
+    for comp in reversed(order):
+        bits = 1 << int(comp)
+        for succ in indices[indptr[comp] : indptr[comp + 1]]:
+            bits |= reach[succ]
+        reach[comp] = bits
+
+    number_of_bytes = (number_of_components + 7) // 8
+    reachable_states = []
+    for bits in reach:
+        comp_mask = np.unpackbits(
+            np.frombuffer(bits.to_bytes(number_of_bytes, "little"), dtype=np.uint8),
+            count=number_of_components,
+            bitorder="little",
+        ).astype(bool)
+        reachable_states.append(np.flatnonzero(comp_mask[labels]))
+
+    row_lengths = np.array([len(reachable_states[comp]) for comp in labels])
+    indptr = np.zeros(number_of_states + 1, dtype=np.int64)
+    np.cumsum(row_lengths, out=indptr[1:])
+    indices = (
+        np.concatenate([reachable_states[comp] for comp in labels])
+        if number_of_states > 0
+        else np.zeros(0, dtype=np.int64)
+    )
+
+    return csr_matrix(
+        (np.ones(len(indices), dtype=bool), indices, indptr),
+        shape=(number_of_states, number_of_states),
+    )
+
+
+# Forward BFS from the sources that stops as soon as a target is reached.
+# With backward=True the edges are followed in reverse direction
+def is_reachable(
+    adjacency: csr_matrix,
+    sources: np.ndarray,
+    targets: np.ndarray,
+    backward: bool = False,
+) -> bool:
+    visited = sources.copy()
+    front = sources
+
+    while front.any():
+        if (front & targets).any():
+            return True
+        step = adjacency @ front if backward else front @ adjacency
+        front = step & ~visited
+        visited |= front
+
+    return False
+
+
+# Set difference of boolean sparse matrices: the entries of minuend that
+# are not in subtrahend
+def difference(minuend: csr_matrix, subtrahend: csr_matrix) -> csr_matrix:
+    return (
+        minuend.astype(np.int8) - minuend.multiply(subtrahend).astype(np.int8)
+    ).astype(bool)
+
+
+# Multi-source BFS: row i of sources is the i-th set of start states, row
+# i of the result is everything reachable from that set. Every level only
+# expands the newly reached states
+def reachable_from(adjacency: csr_matrix, sources: csr_matrix) -> csr_matrix:
+    visited = csr_matrix(sources, dtype=bool)
+    front = visited
+
+    while front.nnz > 0:
+        reached = front @ adjacency
+        front = difference(reached, visited)
+        visited = visited + front
+
+    return visited
+
+
+# Maintained closure after inserting the edge source -> target: every
+# state reaching source now also reaches everything target reaches
+def insert_closure_edge(closure: BitMatrix, source: int, target: int):
+    rows = closure.column(source)
+    closure.words[rows] |= closure.words[target]
+
+
+# Maintained closure after deleting an edge out of some state u: only the
+# rows of the states reaching u can shrink. They are rebuilt from their
+# current successors, components of the affected subgraph in reverse
+# topological order, while the rows of all other states are reused as is
+def recompute_closure_rows(
+    closure: BitMatrix,
+    rows: np.ndarray,
+    successors: Callable[[int], Iterable[int]],
+):
+    local_id = {int(state): i for i, state in enumerate(rows)}
+    local_rows, local_cols = [], []
+    outside: list[list[int]] = [[] for _ in rows]
+
+    for i, state in enumerate(rows):
+        for succ in successors(int(state)):
+            j = local_id.get(int(succ))
+            if j is None:
+                outside[i].append(int(succ))
+            else:
+                local_rows.append(i)
+                local_cols.append(j)
+
+    induced = coo_matrix(
+        (np.ones(len(local_rows), dtype=bool), (local_rows, local_cols)),
+        shape=(len(rows), len(rows)),
+    ).tocsr()
+    number_of_components, labels, condensation = _condensation(induced)
+    members = [[] for _ in range(number_of_components)]
+    for i, comp in enumerate(labels):
+        members[comp].append(i)
+
+    reach = np.zeros((number_of_components, closure.words.shape[1]), dtype=np.uint64)
+    for comp in reversed(_topological_order(condensation)):
+        states = rows[members[comp]]
+        np.bitwise_or.at(
+            reach[comp],
+            states // WORD_BITS,
+            np.left_shift(np.uint64(1), (states % WORD_BITS).astype(np.uint64)),
+        )
+        reached = [succ for i in members[comp] for succ in outside[i]]
+        if reached:
+            reach[comp] |= np.bitwise_or.reduce(closure.words[reached], axis=0)
+        succ_comps = condensation.indices[
+            condensation.indptr[comp] : condensation.indptr[comp + 1]
+        ]
+        if len(succ_comps) > 0:
+            reach[comp] |= np.bitwise_or.reduce(reach[succ_comps], axis=0)
+        closure.words[states] = reach[comp]
+
+
+CLOSURE_STRATEGIES = {
+    "dense": dense_closure,
+    "squaring": squaring_closure,
+    "bfs": bfs_closure,
+    "scc": scc_closure,
+    "bitpacked": bitpacked_closure,
+}
+
+
+def _auto_strategy(adjacency: csr_matrix | BitMatrix) -> str:
+    if isinstance(adjacency, BitMatrix):
+        return "bitpacked"
+    if adjacency.shape[0] <= DENSE_THRESHOLD:
+        return "dense"
+    return "scc"
+
+
+# Reflexive transitive closure of a boolean adjacency matrix. "auto" keeps
+# the dense path for tiny automata, stays bit-packed for bit-packed input
+# and collapses SCCs otherwise
+def transitive_closure(
+    adjacency: csr_matrix | BitMatrix, strategy: str = "auto"
+) -> csr_matrix:
+    if strategy == "auto":
+        strategy = _auto_strategy(adjacency)
+
+    if isinstance(adjacency, BitMatrix):
+        if strategy == "bitpacked":
+            return adjacency.closure().tocsr()
+        adjacency = adjacency.tocsr()
+
+    if strategy not in CLOSURE_STRATEGIES:
+        raise ValueError(
+            f"Unknown closure strategy {strategy!r}, "
+            f"expected one of {', '.join(['auto', *CLOSURE_STRATEGIES])}"
+        )
+
+    return CLOSURE_STRATEGIES[strategy](csr_matrix(adjacency, dtype=bool))
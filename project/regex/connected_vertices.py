@@ -1,7 +1,71 @@
 import networkx as nx
+import numpy as np
+from pyformlang.finite_automaton import Symbol
+from scipy.sparse import coo_matrix, csr_matrix
 
 from project.regex.adjacency_matrix_fa import AdjacencyMatrixFA, intersect_automata
-from project.regex.create_finite_automaton import regex_to_dfa, graph_to_nfa
+from project.regex.bit_matrix import to_backend
+from project.regex.closure import reachable_from
+from project.regex.create_finite_automaton import graph_to_matrix_fa
+from project.regex.glushkov import compile_regex, regex_to_matrix_fa
+from project.regex.pruning import pruned_query_arrays, regex_alphabet
+from project.regex.regex_cache import CompiledRegex
+
+
+# With more start nodes than this share of the graph a BFS per start costs
+# more than the full closure of the product
+FULL_CLOSURE_START_SHARE = 0.5
+
+
+# The answer as two aligned arrays of start and final nodes, so that large
+# answers are never turned into Python tuples
+# With prune=True the query runs on the graph cut down to the regex labels
+# and the nodes between the start and final nodes, see prune_graph
+def tensor_based_rpq_arrays(
+    regex: str,
+    graph: nx.MultiDiGraph,
+    start_nodes: set[int] = None,
+    final_nodes: set[int] = None,
+    regex_mode: str = "auto",
+    prune: bool = False,
+) -> tuple[np.ndarray, np.ndarray]:
+    if prune:
+        return pruned_query_arrays(
+            tensor_based_rpq_arrays,
+            regex,
+            regex_alphabet(regex, regex_mode),
+            graph,
+            start_nodes,
+            final_nodes,
+            regex_mode,
+        )
+
+    regex_to_matrix = regex_to_matrix_fa(regex, regex_mode)
+    graph_to_matrix = graph_to_matrix_fa(graph, start_nodes, final_nodes)
+    intersection = intersect_automata(regex_to_matrix, graph_to_matrix)
+
+    # Row i holds the product states (regex start, i-th graph start)
+    graph_starts = graph_to_matrix.start_ids
+    regex_starts = regex_to_matrix.start_ids
+    rows = np.repeat(np.arange(len(graph_starts)), len(regex_starts))
+    cols = intersection.product_id(
+        np.tile(regex_starts, len(graph_starts)),
+        np.repeat(graph_starts, len(regex_starts)),
+    )
+    sources = coo_matrix(
+        (np.ones(len(rows), dtype=bool), (rows, cols)),
+        shape=(len(graph_starts), intersection.number_of_states),
+    ).tocsr()
+
+    if len(graph_starts) > FULL_CLOSURE_START_SHARE * graph_to_matrix.number_of_states:
+        reached = sources @ intersection.transitive_сlosure()
+    else:
+        reached = reachable_from(intersection.adjacency_matrix(), sources)
+
+    found = reached[:, intersection.final_ids].tocoo()
+    _, graph_finals = intersection.split_id(intersection.final_ids[found.col])
+
+    return graph_to_matrix.state_pairs(graph_starts[found.row], graph_finals)
 
 
 def tensor_based_rpq(
@@ -9,22 +73,135 @@ def tensor_based_rpq(
     graph: nx.MultiDiGraph,
     start_nodes: set[int] = None,
     final_nodes: set[int] = None,
+    regex_mode: str = "auto",
+    prune: bool = False,
 ) -> set[tuple[int, int]]:
-    regex_to_matrix = AdjacencyMatrixFA(regex_to_dfa(regex))
-    graph_to_matrix = AdjacencyMatrixFA(graph_to_nfa(graph, start_nodes, final_nodes))
-    intersection = intersect_automata(regex_to_matrix, graph_to_matrix)
-    closure = intersection.transitive_сlosure()
-
-    return {
-        (graph_start, graph_final)
-        for graph_start in graph_to_matrix.start_states
-        for graph_final in graph_to_matrix.final_states
-        if any(
-            closure[
-                intersection.state_id[(regex_start, graph_start)],
-                intersection.state_id[(regex_final, graph_final)],
-            ]
-            for regex_start in regex_to_matrix.start_states
-            for regex_final in regex_to_matrix.final_states
+    starts, finals = tensor_based_rpq_arrays(
+        regex, graph, start_nodes, final_nodes, regex_mode, prune
+    )
+    return set(zip(starts.tolist(), finals.tolist()))
+
+
+# Neighbours of the given rows of a CSR structure as (position of the row
+# in rows, neighbour) arrays
+def _neighbours(
+    indptr: np.ndarray, indices: np.ndarray, rows: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    begins = indptr[rows]
+    counts = indptr[rows + 1] - begins
+    origins = np.repeat(np.arange(len(rows)), counts)
+    offsets = np.arange(len(origins)) - np.repeat(np.cumsum(counts) - counts, counts)
+    return origins, indices[begins[origins] + offsets]
+
+
+# Transitions of a compiled regex as one CSR structure with a row
+# label * states + state for every label and state, built from the
+# transition table without scipy. With reverse=True the transitions are
+# followed backward
+def _regex_adjacency(
+    compiled: CompiledRegex, reverse: bool = False
+) -> tuple[np.ndarray, np.ndarray]:
+    table = compiled.transitions.astype(np.int64).reshape(-1, 3)
+    sources, targets = (
+        (table[:, 2], table[:, 0]) if reverse else (table[:, 0], table[:, 2])
+    )
+    rows = table[:, 1] * compiled.number_of_states + sources
+    order = np.argsort(rows, kind="stable")
+    counts = np.bincount(
+        rows, minlength=len(compiled.symbols) * compiled.number_of_states
+    )
+    return np.concatenate([[0], np.cumsum(counts)]), targets[order]
+
+
+# One BFS level in the product without building it: for every shared label
+# the regex successors of the regex state and the graph successors of the
+# node of each product state q * n + x are combined
+def _expand(
+    states: np.ndarray,
+    regex_adjacency: tuple[np.ndarray, np.ndarray],
+    graph_matrices: list[csr_matrix],
+    labels: list[tuple[int, int]],
+    number_of_regex_states: int,
+    number_of_nodes: int,
+) -> np.ndarray:
+    regex_ids, node_ids = np.divmod(states, number_of_nodes)
+    reached = [np.zeros(0, dtype=np.int64)]
+
+    for regex_label, graph_label in labels:
+        regex_origins, regex_targets = _neighbours(
+            *regex_adjacency, regex_label * number_of_regex_states + regex_ids
+        )
+        matrix = graph_matrices[graph_label]
+        graph_origins, graph_targets = _neighbours(
+            matrix.indptr, matrix.indices, node_ids[regex_origins]
         )
-    }
+        reached.append(regex_targets[graph_origins] * number_of_nodes + graph_targets)
+
+    return np.unique(np.concatenate(reached))
+
+
+# Whether some path from u to v matches the regex. The product of the regex
+# and graph automata is searched forward from (regex start, u) and backward
+# from (regex final, v), always expanding the smaller frontier, and the
+# search stops as soon as the two meet. The regex is taken as its compiled
+# transition table, and visited product states are kept in sets, so a check
+# costs in the states it reaches, not in the size of the product. A graph
+# given as AdjacencyMatrixFA is used as is, so repeated checks on it skip
+# building the automaton. Nodes outside the graph are never connected
+def rpq_exists(
+    regex: str,
+    graph: nx.MultiDiGraph | AdjacencyMatrixFA,
+    u,
+    v,
+    regex_mode: str = "auto",
+) -> bool:
+    compiled = compile_regex(regex, regex_mode)
+    graph_fa = (
+        graph if isinstance(graph, AdjacencyMatrixFA) else graph_to_matrix_fa(graph)
+    )
+
+    u_id, v_id = graph_fa.state_id.get(u), graph_fa.state_id.get(v)
+    if u_id is None or compiled.start < 0 or v_id is None:
+        return False
+
+    n = graph_fa.number_of_states
+    r = compiled.number_of_states
+    labels = [
+        (label, graph_fa.symbol_id[symbol])
+        for label, symbol in enumerate(map(Symbol, compiled.symbols))
+        if symbol in graph_fa.symbol_id
+    ]
+    forward = (
+        _regex_adjacency(compiled),
+        [to_backend(matrix, "sparse") for matrix in graph_fa.matrices],
+    )
+    backward = (
+        _regex_adjacency(compiled, reverse=True),
+        graph_fa.transposed_matrices(),
+    )
+
+    forward_front = np.array([compiled.start * n + u_id], dtype=np.int64)
+    backward_front = compiled.finals.astype(np.int64) * n + v_id
+    forward_seen = set(forward_front.tolist())
+    backward_seen = set(backward_front.tolist())
+
+    if not forward_seen.isdisjoint(backward_seen):
+        return True
+
+    while len(forward_front) > 0 and len(backward_front) > 0:
+        if len(forward_front) <= len(backward_front):
+            reached = _expand(forward_front, *forward, labels, r, n).tolist()
+            new = [state for state in reached if state not in forward_seen]
+            if not backward_seen.isdisjoint(new):
+                return True
+            forward_seen.update(new)
+            forward_front = np.array(new, dtype=np.int64)
+        else:
+            reached = _expand(backward_front, *backward, labels, r, n).tolist()
+            new = [state for state in reached if state not in backward_seen]
+            if not forward_seen.isdisjoint(new):
+                return True
+            backward_seen.update(new)
+            backward_front = np.array(new, dtype=np.int64)
+
+    return False
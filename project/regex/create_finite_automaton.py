@@ -1,16 +1,40 @@
 from networkx import MultiDiGraph
+import numpy as np
 import pyformlang.finite_automaton as fa
 from pyformlang.regular_expression import Regex
 
+from project.regex.adjacency_matrix_fa import AdjacencyMatrixFA, label_matrices
+from project.regex.closure import transitive_closure
+from project.regex.graph_cache import GraphCache, GraphMatrices, graph_edges
+from project.regex.regex_cache import CompiledRegex, RegexCache
 
-# Constructing a minimal DFA using a given regular expression.
-def regex_to_dfa(regex: str) -> fa.DeterministicFiniteAutomaton:
+
+# Compiled regexes shared by all regex_to_dfa calls, see
+# RegexCache.configure for the size and the on-disk store
+regex_cache = RegexCache()
+
+# Matrices of the graphs queried recently, see GraphCache.configure for the
+# memory budget
+graph_cache = GraphCache()
+
+
+def _compile_dfa(regex: str) -> fa.DeterministicFiniteAutomaton:
     nfa = Regex(regex).to_epsilon_nfa()
     dfa = nfa.to_deterministic()
 
     return dfa.minimize()
 
 
+def _compile_table(regex: str) -> CompiledRegex:
+    return CompiledRegex.from_dfa(_compile_dfa(regex))
+
+
+# Constructing a minimal DFA using a given regular expression.
+# Every call gets its own automaton rebuilt from the cached transition table
+def regex_to_dfa(regex: str) -> fa.DeterministicFiniteAutomaton:
+    return regex_cache.get(regex, _compile_table, kind="pyformlang_dfa").to_dfa()
+
+
 # Construction of a non-deterministic finite automaton from a graph
 def graph_to_nfa(
     graph: MultiDiGraph, start_states: set[int], final_states: set[int]
@@ -31,3 +55,129 @@ def graph_to_nfa(
         nfa.add_final_state(f)
 
     return nfa
+
+
+EPSILON_LABELS = ("epsilon", "ɛ")
+
+
+def _is_epsilon(label) -> bool:
+    return isinstance(label, fa.Epsilon) or label in EPSILON_LABELS
+
+
+# Graph matrices straight from the edge list, the automaton being the same
+# as AdjacencyMatrixFA(graph_to_nfa(...)) without pyformlang objects:
+# epsilon edges are removed only if there are any, and the marks of
+# is_start / is_final nodes are carried along their epsilon edges
+def _graph_matrices(
+    nodes: list,
+    sources: np.ndarray,
+    labels: np.ndarray,
+    targets: np.ndarray,
+    symbols: list,
+    marked_start: np.ndarray,
+    marked_final: np.ndarray,
+) -> GraphMatrices:
+    number_of_nodes = len(nodes)
+    matrices = label_matrices(sources, labels, targets, len(symbols), number_of_nodes)
+    edge_matrices = dict(zip(symbols, matrices))
+
+    epsilon = [i for i, symbol in enumerate(symbols) if _is_epsilon(symbol)]
+    if epsilon:
+        eclose = transitive_closure(sum(matrices[i] for i in epsilon))
+        symbols = [s for i, s in enumerate(symbols) if i not in epsilon]
+        matrices = [
+            (eclose @ matrix).tocsr()
+            for i, matrix in enumerate(matrices)
+            if i not in epsilon
+        ]
+        marked_start = marked_start | (marked_start @ eclose)
+        marked_final = marked_final | (eclose @ marked_final)
+
+    graph_fa = AdjacencyMatrixFA()
+    graph_fa.number_of_states = number_of_nodes
+    graph_fa.states = nodes
+    graph_fa.decomposition = dict(zip(map(fa.Symbol, symbols), matrices))
+    return GraphMatrices(graph_fa, marked_start, marked_final, edge_matrices)
+
+
+# The given start and final nodes are added to the nodes marked is_start /
+# is_final, nodes outside the graph as isolated nodes
+def _edges_to_matrix_fa(
+    nodes: list,
+    sources: np.ndarray,
+    labels: np.ndarray,
+    targets: np.ndarray,
+    symbols: list,
+    marked_start: np.ndarray,
+    marked_final: np.ndarray,
+    start_states,
+    final_states,
+) -> AdjacencyMatrixFA:
+    node_id = {node: i for i, node in enumerate(nodes)}
+    for node in [*(start_states or ()), *(final_states or ())]:
+        if node not in node_id:
+            node_id[node] = len(nodes)
+            nodes.append(node)
+    unmarked = np.zeros(len(nodes) - len(marked_start), dtype=bool)
+
+    return _graph_matrices(
+        nodes,
+        sources,
+        labels,
+        targets,
+        symbols,
+        np.concatenate([marked_start, unmarked]),
+        np.concatenate([marked_final, unmarked]),
+    ).matrix_fa(start_states, final_states)
+
+
+# Matrices of a graph through the graph cache, built on a miss
+def graph_matrices(graph: MultiDiGraph) -> GraphMatrices:
+    return graph_cache.get(graph, lambda edges: _graph_matrices(*edges))
+
+
+# Start or final nodes outside the graph change its matrices, such queries
+# bypass the cache
+def graph_to_matrix_fa(
+    graph: MultiDiGraph, start_states: set = None, final_states: set = None
+) -> AdjacencyMatrixFA:
+    if any(
+        node not in graph for node in [*(start_states or ()), *(final_states or ())]
+    ):
+        return _edges_to_matrix_fa(*graph_edges(graph), start_states, final_states)
+    return graph_matrices(graph).matrix_fa(start_states, final_states)
+
+
+# The same from (source, label, target) arrays. Nodes without edges can be
+# listed in nodes; no node is marked as start or final
+def edges_to_matrix_fa(
+    sources: np.ndarray,
+    labels: np.ndarray,
+    targets: np.ndarray,
+    start_states: set = None,
+    final_states: set = None,
+    nodes: np.ndarray = None,
+) -> AdjacencyMatrixFA:
+    sources, targets = np.asarray(sources), np.asarray(targets)
+    all_nodes = np.concatenate(
+        [
+            np.asarray(nodes if nodes is not None else [], dtype=sources.dtype),
+            sources,
+            targets,
+        ]
+    )
+    node_values, node_ids = np.unique(all_nodes, return_inverse=True)
+    edge_ids = node_ids[len(all_nodes) - 2 * len(sources) :]
+    symbols, label_ids = np.unique(np.asarray(labels), return_inverse=True)
+
+    return _edges_to_matrix_fa(
+        node_values.tolist(),
+        edge_ids[: len(sources)].astype(np.int64),
+        label_ids.astype(np.int64),
+        edge_ids[len(sources) :].astype(np.int64),
+        symbols.tolist(),
+        np.zeros(len(node_values), dtype=bool),
+        np.zeros(len(node_values), dtype=bool),
+        start_states,
+        final_states,
+    )
@@ -0,0 +1,167 @@
+import json
+import os
+import struct
+
+import numpy as np
+from pyformlang.finite_automaton import Symbol
+from scipy.sparse import csr_matrix
+
+from project.regex.adjacency_matrix_fa import AdjacencyMatrixFA
+from project.regex.bit_matrix import to_backend
+
+
+# File layout: magic, format version, header length, JSON header (for an
+# automaton the state and symbol tables) with the array directory, then the
+# arrays, every one aligned to ALIGNMENT bytes so that it can be
+# memory-mapped in place
+MAGIC = b"AMFA"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+_PREAMBLE = struct.Struct("<4sIQ")
+
+
+# State and symbol values are ints, strings or (nested) tuples of them;
+# tuples are tagged since JSON only has lists
+def _encode_value(value):
+    if isinstance(value, tuple):
+        return {"tuple": [_encode_value(item) for item in value]}
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    raise ValueError(f"Cannot store value {value!r} of type {type(value).__name__}")
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        return tuple(_decode_value(item) for item in value["tuple"])
+    return value
+
+
+def _aligned(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+# Arrays with a JSON header in the file layout above; the header gets the
+# array directory under "arrays"
+def save_arrays(
+    path: str | os.PathLike,
+    magic: bytes,
+    version: int,
+    header: dict,
+    arrays: dict[str, np.ndarray],
+):
+    directory = {}
+    offset = 0
+    for name, array in arrays.items():
+        directory[name] = {
+            "offset": offset,
+            "length": len(array),
+            "dtype": array.dtype.str,
+        }
+        offset = _aligned(offset + array.nbytes)
+
+    header = json.dumps({**header, "arrays": directory}).encode()
+    data_start = _aligned(_PREAMBLE.size + len(header))
+
+    with open(path, "wb") as file:
+        file.write(_PREAMBLE.pack(magic, version, len(header)))
+        file.write(header)
+        for name, array in arrays.items():
+            file.seek(data_start + directory[name]["offset"])
+            file.write(array.tobytes())
+        file.truncate(data_start + offset)
+
+
+# With mmap=True the arrays are read-only views of the file pages, so
+# processes loading the same file share them through the page cache
+def load_arrays(
+    path: str | os.PathLike,
+    magic: bytes,
+    version: int,
+    kind: str,
+    mmap: bool = True,
+) -> tuple[dict, dict[str, np.ndarray]]:
+    with open(path, "rb") as file:
+        file_magic, file_version, header_length = _PREAMBLE.unpack(
+            file.read(_PREAMBLE.size)
+        )
+        if file_magic != magic:
+            raise ValueError(f"{path} is not an {kind} file")
+        if file_version != version:
+            raise ValueError(
+                f"Unsupported {kind} format version {file_version}, expected {version}"
+            )
+        header = json.loads(file.read(header_length))
+        data_start = _aligned(_PREAMBLE.size + header_length)
+
+        arrays = {}
+        for name, entry in header.pop("arrays").items():
+            dtype = np.dtype(entry["dtype"])
+            if entry["length"] == 0:
+                arrays[name] = np.zeros(0, dtype=dtype)
+            elif mmap:
+                arrays[name] = np.memmap(
+                    file,
+                    dtype=dtype,
+                    mode="r",
+                    offset=data_start + entry["offset"],
+                    shape=(entry["length"],),
+                )
+            else:
+                file.seek(data_start + entry["offset"])
+                arrays[name] = np.fromfile(file, dtype=dtype, count=entry["length"])
+
+    return header, arrays
+
+
+def save_adjacency_matrix_fa(fa: AdjacencyMatrixFA, path: str | os.PathLike):
+    arrays = {
+        "start_ids": np.asarray(fa.start_ids, dtype=np.int64),
+        "final_ids": np.asarray(fa.final_ids, dtype=np.int64),
+    }
+    # scipy keeps int32 indices of small matrices and would copy int64 ones
+    index_dtype = np.int32 if fa.number_of_states < 2**31 else np.int64
+    for i, matrix in enumerate(fa.matrices):
+        matrix = to_backend(matrix, "sparse").tocsr()
+        if not matrix.has_canonical_format:
+            matrix = matrix.copy()
+            matrix.sum_duplicates()
+        dtype = index_dtype if matrix.nnz < 2**31 else np.int64
+        arrays[f"indptr_{i}"] = matrix.indptr.astype(dtype)
+        arrays[f"indices_{i}"] = matrix.indices.astype(dtype)
+
+    save_arrays(
+        path,
+        MAGIC,
+        FORMAT_VERSION,
+        {
+            "number_of_states": fa.number_of_states,
+            "states": [_encode_value(value) for value in fa.states],
+            "symbols": [_encode_value(symbol.value) for symbol in fa.symbols],
+        },
+        arrays,
+    )
+
+
+def load_adjacency_matrix_fa(
+    path: str | os.PathLike, mmap: bool = True
+) -> AdjacencyMatrixFA:
+    header, arrays = load_arrays(path, MAGIC, FORMAT_VERSION, "AdjacencyMatrixFA", mmap)
+
+    fa = AdjacencyMatrixFA()
+    fa.number_of_states = header["number_of_states"]
+    fa.states = [_decode_value(value) for value in header["states"]]
+    fa.start_ids = arrays["start_ids"]
+    fa.final_ids = arrays["final_ids"]
+
+    shape = (fa.number_of_states, fa.number_of_states)
+    for i, value in enumerate(header["symbols"]):
+        indices = arrays[f"indices_{i}"]
+        matrix = csr_matrix(
+            (np.ones(len(indices), dtype=bool), indices, arrays[f"indptr_{i}"]),
+            shape=shape,
+            copy=False,
+        )
+        fa.set_symbol_matrix(Symbol(_decode_value(value)), matrix)
+
+    return fa
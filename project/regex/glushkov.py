@@ -0,0 +1,379 @@
+from pyformlang.finite_automaton import Symbol
+from pyformlang.regular_expression.regex_objects import MisformedRegexError
+import numpy as np
+
+from project.regex.adjacency_matrix_fa import AdjacencyMatrixFA
+from project.regex.create_finite_automaton import regex_cache
+from project.regex.regex_cache import CompiledRegex
+
+
+# Operators of the pyformlang regex syntax
+CONCATENATION_SYMBOLS = {"."}
+UNION_SYMBOLS = {"|", "+"}
+KLEENE_STAR_SYMBOLS = {"*"}
+EPSILON_SYMBOLS = {"$", "epsilon"}
+PARENTHESIS = {"(", ")"}
+SPECIAL_SYMBOLS = (
+    CONCATENATION_SYMBOLS | UNION_SYMBOLS | KLEENE_STAR_SYMBOLS | {"$"} | PARENTHESIS
+)
+
+# "auto" mode determinizes only regexes with at most this many symbol
+# occurrences, larger ones stay Glushkov automata
+AUTO_DFA_MAX_POSITIONS = 256
+
+COMPILE_MODES = ("glushkov", "dfa", "auto")
+
+
+# Splitting like pyformlang does: operators and parentheses are tokens of
+# their own, other characters form symbols up to a space or an operator,
+# and a backslash makes the next character ordinary
+def tokenize(regex: str) -> list[str]:
+    tokens = []
+    current = []
+    escaped = False
+
+    for char in regex:
+        if escaped:
+            current.append(char)
+            escaped = False
+        elif char == "\\":
+            current.append(char)
+            escaped = True
+        elif char == " " or char in SPECIAL_SYMBOLS:
+            if current:
+                tokens.append("".join(current))
+                current = []
+            if char != " ":
+                tokens.append(char)
+        else:
+            current.append(char)
+
+    if current:
+        tokens.append("".join(current))
+
+    return tokens
+
+
+# Recursive descent over the tokens with the usual precedence: star binds
+# tighter than concatenation, which binds tighter than union. Concatenation
+# and union nodes are n-ary, so long regexes do not make deep trees
+class _Parser:
+    def __init__(self, tokens: list[str]):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self) -> str | None:
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return None
+
+    def parse(self) -> tuple:
+        if not self.tokens:
+            return ("empty",)
+        node = self.union()
+        if self.peek() is not None:
+            raise MisformedRegexError("Wrong parenthesis regex", " ".join(self.tokens))
+        return node
+
+    # pyformlang takes a missing operand after the last operator of a group
+    # as the empty language: "a|" is "a" and "a." matches nothing
+    def _group_ends(self) -> bool:
+        return self.peek() is None or self.peek() == ")"
+
+    def union(self) -> tuple:
+        children = [self.concatenation()]
+        while self.peek() in UNION_SYMBOLS:
+            self.position += 1
+            if self._group_ends():
+                children.append(("empty",))
+                break
+            children.append(self.concatenation())
+        return children[0] if len(children) == 1 else ("union", children)
+
+    def concatenation(self) -> tuple:
+        children = [self.star()]
+        while True:
+            token = self.peek()
+            if token in CONCATENATION_SYMBOLS:
+                self.position += 1
+                if self._group_ends():
+                    children.append(("empty",))
+                    break
+            elif token is None or token == ")" or token in UNION_SYMBOLS:
+                break
+            children.append(self.star())
+        return children[0] if len(children) == 1 else ("concat", children)
+
+    def star(self) -> tuple:
+        node = self.atom()
+        while self.peek() in KLEENE_STAR_SYMBOLS:
+            self.position += 1
+            node = ("star", node)
+        return node
+
+    def atom(self) -> tuple:
+        token = self.peek()
+        if token is None or token == ")" or token in SPECIAL_SYMBOLS - {"(", "$"}:
+            raise MisformedRegexError(
+                "The regex is misformed here.", " ".join(self.tokens)
+            )
+
+        self.position += 1
+        if token == "(":
+            node = self.union()
+            if self.peek() != ")":
+                raise MisformedRegexError(
+                    "Wrong parenthesis regex", " ".join(self.tokens)
+                )
+            self.position += 1
+            return node
+        if token in EPSILON_SYMBOLS:
+            return ("epsilon",)
+        if token.startswith("\\"):
+            return ("symbol", token[1:])
+        return ("symbol", token)
+
+
+def parse_regex(regex: str) -> tuple:
+    return _Parser(tokenize(regex)).parse()
+
+
+# Glushkov automaton: one state per symbol occurrence plus the initial
+# state 0, no epsilon transitions. Returns (nullable, first, last) of the
+# node and fills the follow sets and the symbol of every position
+def _positions(node: tuple, symbols: list, follow: list[set[int]]):
+    kind = node[0]
+
+    if kind == "symbol":
+        symbols.append(node[1])
+        follow.append(set())
+        position = len(symbols)
+        return False, {position}, {position}
+
+    if kind == "epsilon":
+        return True, set(), set()
+
+    if kind == "empty":
+        return False, set(), set()
+
+    if kind == "star":
+        _, first, last = _positions(node[1], symbols, follow)
+        for position in last:
+            follow[position - 1] |= first
+        return True, first, last
+
+    parts = [_positions(child, symbols, follow) for child in node[1]]
+
+    if kind == "union":
+        return (
+            any(nullable for nullable, _, _ in parts),
+            set().union(*(first for _, first, _ in parts)),
+            set().union(*(last for _, _, last in parts)),
+        )
+
+    # Concatenation: the last positions of a part are followed by the first
+    # positions of the next parts up to the first non-nullable one
+    suffix_first: set[int] = set()
+    suffix_nullable = True
+    for nullable, first, last in reversed(parts):
+        for position in last:
+            follow[position - 1] |= suffix_first
+        suffix_first = first | suffix_first if nullable else set(first)
+        suffix_nullable = suffix_nullable and nullable
+
+    first: set[int] = set()
+    for nullable, part_first, _ in parts:
+        first |= part_first
+        if not nullable:
+            break
+
+    last: set[int] = set()
+    for nullable, _, part_last in reversed(parts):
+        last |= part_last
+        if not nullable:
+            break
+
+    return suffix_nullable, first, last
+
+
+def glushkov(regex: str) -> CompiledRegex:
+    symbols: list = []
+    follow: list[set[int]] = []
+    nullable, first, last = _positions(parse_regex(regex), symbols, follow)
+
+    labels = list(dict.fromkeys(symbols))
+    label_id = {symbol: i for i, symbol in enumerate(labels)}
+    position_label = [label_id[symbol] for symbol in symbols]
+
+    transitions = [(0, position_label[q - 1], q) for q in sorted(first)]
+    for p, targets in enumerate(follow, start=1):
+        transitions.extend((p, position_label[q - 1], q) for q in sorted(targets))
+
+    finals = sorted(last | {0}) if nullable else sorted(last)
+
+    return CompiledRegex(
+        len(symbols) + 1,
+        0,
+        np.array(finals, dtype=np.int32),
+        labels,
+        np.array(transitions, dtype=np.int32).reshape(-1, 3),
+    )
+
+
+def _successors(compiled: CompiledRegex) -> list[dict[int, list[int]]]:
+    successors = [{} for _ in range(compiled.number_of_states)]
+    for from_st, label, to_st in compiled.transitions.tolist():
+        successors[from_st].setdefault(label, []).append(to_st)
+    return successors
+
+
+# Subset construction on the integer table. Gives up and returns None as
+# soon as the DFA would have more than max_states states
+def determinize(
+    compiled: CompiledRegex, max_states: int = None
+) -> CompiledRegex | None:
+    if compiled.start < 0:
+        return compiled
+
+    successors = _successors(compiled)
+    finals = set(compiled.finals.tolist())
+    start = frozenset([compiled.start])
+    subset_id = {start: 0}
+    queue = [start]
+    transitions = []
+
+    while queue:
+        subset = queue.pop()
+        targets: dict[int, set[int]] = {}
+        for state in subset:
+            for label, states in successors[state].items():
+                targets.setdefault(label, set()).update(states)
+
+        for label, states in targets.items():
+            target = frozenset(states)
+            if target not in subset_id:
+                if max_states is not None and len(subset_id) >= max_states:
+                    return None
+                subset_id[target] = len(subset_id)
+                queue.append(target)
+            transitions.append((subset_id[subset], label, subset_id[target]))
+
+    return CompiledRegex(
+        len(subset_id),
+        0,
+        np.array(
+            sorted(i for subset, i in subset_id.items() if subset & finals),
+            dtype=np.int32,
+        ),
+        compiled.symbols,
+        np.array(transitions, dtype=np.int32).reshape(-1, 3),
+    )
+
+
+# Minimizing a partial DFA: states that cannot reach a final state are
+# dropped, the rest is refined by Moore's algorithm
+def minimize(dfa: CompiledRegex) -> CompiledRegex:
+    predecessors = [[] for _ in range(dfa.number_of_states)]
+    for from_st, _, to_st in dfa.transitions.tolist():
+        predecessors[to_st].append(from_st)
+
+    alive = set(dfa.finals.tolist())
+    stack = list(alive)
+    while stack:
+        for state in predecessors[stack.pop()]:
+            if state not in alive:
+                alive.add(state)
+                stack.append(state)
+
+    if dfa.start not in alive:
+        return CompiledRegex(
+            0,
+            -1,
+            np.zeros(0, dtype=np.int32),
+            dfa.symbols,
+            np.zeros((0, 3), dtype=np.int32),
+        )
+
+    delta = [{} for _ in range(dfa.number_of_states)]
+    for from_st, label, to_st in dfa.transitions.tolist():
+        if from_st in alive and to_st in alive:
+            delta[from_st][label] = to_st
+
+    states = sorted(alive)
+    finals = set(dfa.finals.tolist())
+    block = {state: int(state in finals) for state in states}
+    number_of_blocks = len(set(block.values()))
+
+    while True:
+        signatures: dict[tuple, int] = {}
+        next_block = {}
+        for state in states:
+            signature = (
+                block[state],
+                tuple(sorted((label, block[to]) for label, to in delta[state].items())),
+            )
+            next_block[state] = signatures.setdefault(signature, len(signatures))
+        block = next_block
+        if len(signatures) == number_of_blocks:
+            break
+        number_of_blocks = len(signatures)
+
+    transitions = sorted(
+        {
+            (block[from_st], label, block[to_st])
+            for from_st in states
+            for label, to_st in delta[from_st].items()
+        }
+    )
+
+    return CompiledRegex(
+        number_of_blocks,
+        block[dfa.start],
+        np.array(sorted({block[state] for state in finals & alive}), dtype=np.int32),
+        dfa.symbols,
+        np.array(transitions, dtype=np.int32).reshape(-1, 3),
+    )
+
+
+def _compile(regex: str, mode: str) -> CompiledRegex:
+    automaton = glushkov(regex)
+
+    if mode == "dfa":
+        return minimize(determinize(automaton))
+
+    if automaton.number_of_states - 1 > AUTO_DFA_MAX_POSITIONS:
+        return automaton
+
+    # A minimal DFA is used only if subset construction does not make it
+    # larger than the Glushkov automaton
+    dfa = determinize(automaton, automaton.number_of_states)
+    return automaton if dfa is None else minimize(dfa)
+
+
+# Compiling a regex straight into integer tables, cached like regex_to_dfa
+def compile_regex(regex: str, mode: str = "auto") -> CompiledRegex:
+    if mode not in COMPILE_MODES:
+        raise ValueError(
+            f"Unknown regex compile mode {mode!r}, "
+            f"expected one of {', '.join(COMPILE_MODES)}"
+        )
+
+    if mode == "glushkov":
+        return glushkov(regex)
+
+    return regex_cache.get(
+        regex, lambda key: _compile(key, mode), kind=f"native_{mode}"
+    )
+
+
+def regex_to_matrix_fa(regex: str, mode: str = "auto") -> AdjacencyMatrixFA:
+    compiled = compile_regex(regex, mode)
+    start_ids = [compiled.start] if compiled.start >= 0 else []
+
+    return AdjacencyMatrixFA.from_table(
+        compiled.number_of_states,
+        start_ids,
+        compiled.finals,
+        [Symbol(value) for value in compiled.symbols],
+        compiled.transitions,
+    )
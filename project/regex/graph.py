@@ -1,23 +1,69 @@
+import os
+from pathlib import Path
+
 import cfpq_data as cfpq
 from networkx.drawing import nx_pydot
 import networkx as nx
 
+from project.regex.graph_stats import (
+    GraphStats,
+    csv_stats,
+    load_stats,
+    save_stats,
+    store_stats,
+)
+from project.regex.graph_store import (
+    StoredGraph,
+    convert_csv,
+    graph_store_path,
+    open_graph_store,
+)
+
+
+STATS_SUFFIX = ".info.json"
+
+
+# Getting a graph by name. The dataset CSV is downloaded and converted into
+# a graph store once, later calls map the store without network access.
+# The result is a read-only StoredGraph, not a MultiDiGraph: the networkx
+# API is answered by a frozen graph built on first use, so edits raise
+# NetworkXError. nx.MultiDiGraph(load_graph(name).to_networkx()) gives a
+# graph that can be edited
+def load_graph(name, store_dir: str | os.PathLike = None) -> StoredGraph:
+    path = graph_store_path(name, store_dir)
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        convert_csv(cfpq.download(name), path)
+    return open_graph_store(path)
+
+
+def graph_stats_path(name, store_dir: str | os.PathLike = None) -> Path:
+    return graph_store_path(name, store_dir).with_suffix(STATS_SUFFIX)
+
+
+# Statistics of a graph by name, computed in one pass over its graph store,
+# or over the dataset CSV if there is no store yet, and cached next to the
+# store
+def graph_stats(graph_name, store_dir: str | os.PathLike = None) -> GraphStats:
+    path = graph_stats_path(graph_name, store_dir)
+    if path.exists():
+        return load_stats(path)
+
+    store = graph_store_path(graph_name, store_dir)
+    if store.exists():
+        stats = store_stats(open_graph_store(store))
+    else:
+        stats = csv_stats(cfpq.download(graph_name))
 
-# Getting a graph by name
-def load_graph(name):
-    graph_path = cfpq.download(name)
-    graph = cfpq.graph_from_csv(graph_path)
-    return graph
+    path.parent.mkdir(parents=True, exist_ok=True)
+    save_stats(stats, path)
+    return stats
 
 
 # Returning the number of nodes, edges, and listing labels by graph name
-def graph_info(graph_name):
-    graph = load_graph(graph_name)
-    return (
-        graph.number_of_nodes(),
-        graph.number_of_edges(),
-        cfpq.get_sorted_labels(graph),
-    )
+def graph_info(graph_name, store_dir: str | os.PathLike = None):
+    stats = graph_stats(graph_name, store_dir)
+    return stats.number_of_nodes, stats.number_of_edges, stats.labels
 
 
 # Saving the graph to the specified file in DOT format
@@ -0,0 +1,330 @@
+import hashlib
+import pickle
+import sys
+import weakref
+from collections import OrderedDict, namedtuple
+from typing import Callable, Iterable
+
+import networkx as nx
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from project.regex.adjacency_matrix_fa import AdjacencyMatrixFA, matrix_nbytes
+from project.regex.graph_store import StoredGraph
+
+
+GraphCacheInfo = namedtuple(
+    "GraphCacheInfo", ["hits", "misses", "memory_budget", "currsize", "nbytes"]
+)
+
+# Cached matrices of all graphs together stay below this many bytes
+DEFAULT_MEMORY_BUDGET = 1 << 30
+
+# The edge list of a graph as the matrix builders take it: node and label
+# ids index into nodes and symbols, edges without a label are left out
+GraphEdges = namedtuple(
+    "GraphEdges",
+    [
+        "nodes",
+        "sources",
+        "labels",
+        "targets",
+        "symbols",
+        "marked_start",
+        "marked_final",
+    ],
+)
+
+
+# A StoredGraph gives its arrays without building a networkx graph
+def graph_edges(graph: nx.DiGraph | StoredGraph) -> GraphEdges:
+    if isinstance(graph, StoredGraph):
+        labelled = graph.labels >= 0
+        unmarked = np.zeros(graph.number_of_nodes(), dtype=bool)
+        return GraphEdges(
+            graph.node_values.tolist(),
+            graph.sources[labelled].astype(np.int64),
+            graph.labels[labelled].astype(np.int64),
+            graph.targets[labelled].astype(np.int64),
+            list(graph.symbols),
+            unmarked,
+            unmarked,
+        )
+
+    nodes = list(graph.nodes)
+    node_id = {node: i for i, node in enumerate(nodes)}
+    label_id = {}
+    sources, labels, targets = [], [], []
+
+    for source, target, label in graph.edges(data="label"):
+        if label is None:
+            continue
+        sources.append(node_id[source])
+        labels.append(label_id.setdefault(label, len(label_id)))
+        targets.append(node_id[target])
+
+    return GraphEdges(
+        nodes,
+        np.asarray(sources, dtype=np.int64),
+        np.asarray(labels, dtype=np.int64),
+        np.asarray(targets, dtype=np.int64),
+        list(label_id),
+        np.array([bool(flag) for _, flag in graph.nodes(data="is_start")], dtype=bool),
+        np.array([bool(flag) for _, flag in graph.nodes(data="is_final")], dtype=bool),
+    )
+
+
+# Content digest of an edge list: the node and label tables pickled, the
+# edge arrays and the node marks as raw bytes. Equal graphs with nodes or
+# edges in another order get other digests. None if a node or a label
+# cannot be pickled
+def edges_fingerprint(edges: GraphEdges) -> bytes | None:
+    digest = hashlib.blake2b(digest_size=16)
+    try:
+        digest.update(pickle.dumps((edges.nodes, edges.symbols), protocol=5))
+    except (pickle.PicklingError, TypeError, AttributeError):
+        return None
+
+    digest.update(np.int64(len(edges.sources)).tobytes())
+    for array in (edges.sources, edges.labels, edges.targets):
+        digest.update(np.ascontiguousarray(array, dtype=np.int64).tobytes())
+    for array in (edges.marked_start, edges.marked_final):
+        digest.update(np.ascontiguousarray(array, dtype=bool).tobytes())
+    return digest.digest()
+
+
+def graph_fingerprint(graph: nx.DiGraph | StoredGraph) -> bytes | None:
+    return edges_fingerprint(graph_edges(graph))
+
+
+def _same_edges(edges: GraphEdges, other: GraphEdges) -> bool:
+    return (
+        edges.nodes == other.nodes
+        and edges.symbols == other.symbols
+        and all(
+            np.array_equal(array, other_array)
+            for array, other_array in zip(
+                edges[1:4] + edges[5:], other[1:4] + other[5:]
+            )
+        )
+    )
+
+
+# MultiDiGraph that counts its edits, so the graph cache knows without a
+# pass over it that it has not changed since its last lookup. Node and
+# edge attributes changed through the attribute dicts are not counted
+class FingerprintedGraph(nx.MultiDiGraph):
+    version = 0
+
+    def add_node(self, node_for_adding, **attr):
+        super().add_node(node_for_adding, **attr)
+        self.version += 1
+
+    def add_nodes_from(self, nodes_for_adding: Iterable, **attr):
+        super().add_nodes_from(nodes_for_adding, **attr)
+        self.version += 1
+
+    def remove_node(self, n):
+        super().remove_node(n)
+        self.version += 1
+
+    def remove_nodes_from(self, nodes: Iterable):
+        super().remove_nodes_from(nodes)
+        self.version += 1
+
+    # The networkx add_edges_from sets the attributes after add_edge, so it
+    # counts as an edit of its own
+    def add_edge(self, u_for_edge, v_for_edge, key=None, **attr):
+        key = super().add_edge(u_for_edge, v_for_edge, key, **attr)
+        self.version += 1
+        return key
+
+    def add_edges_from(self, ebunch_to_add: Iterable, **attr):
+        keys = super().add_edges_from(ebunch_to_add, **attr)
+        self.version += 1
+        return keys
+
+    def remove_edge(self, u, v, key=None):
+        super().remove_edge(u, v, key)
+        self.version += 1
+
+    def remove_edges_from(self, ebunch: Iterable):
+        super().remove_edges_from(ebunch)
+        self.version += 1
+
+    def clear(self):
+        super().clear()
+        self.version += 1
+
+    def clear_edges(self):
+        super().clear_edges()
+        self.version += 1
+
+
+# Version of a graph whose edits are tracked, None for any other graph.
+# The arrays of a StoredGraph never change
+def graph_version(graph: nx.DiGraph | StoredGraph) -> int | None:
+    if isinstance(graph, StoredGraph):
+        return 0
+    if isinstance(graph, FingerprintedGraph):
+        return graph.version
+    return None
+
+
+# What the matrix engines need of a graph: the automaton of graph_to_nfa
+# with every node as a state and the marked start and final nodes, and
+# the matrix of every edge label as it is in the graph, epsilon included
+class GraphMatrices:
+    __slots__ = ("automaton", "marked_start", "marked_final", "edge_matrices")
+
+    def __init__(
+        self,
+        automaton: AdjacencyMatrixFA,
+        marked_start: np.ndarray,
+        marked_final: np.ndarray,
+        edge_matrices: dict[object, csr_matrix],
+    ):
+        self.automaton = automaton
+        self.marked_start = marked_start
+        self.marked_final = marked_final
+        self.edge_matrices = edge_matrices
+
+    # Start and final nodes must be nodes of the graph. Without them all
+    # nodes are start / final
+    def matrix_fa(
+        self, start_states: set = None, final_states: set = None
+    ) -> AdjacencyMatrixFA:
+        node_id = self.automaton.state_id
+        start_mask = self.marked_start.copy()
+        final_mask = self.marked_final.copy()
+        if start_states:
+            start_mask[[node_id[node] for node in start_states]] = True
+        else:
+            start_mask[:] = True
+        if final_states:
+            final_mask[[node_id[node] for node in final_states]] = True
+        else:
+            final_mask[:] = True
+
+        return self.automaton.with_start_final(
+            np.flatnonzero(start_mask), np.flatnonzero(final_mask)
+        )
+
+    # Matrices, masks and the node containers; node values themselves are
+    # shared with the graph
+    def nbytes(self) -> int:
+        automaton = self.automaton
+        matrices = {
+            id(matrix): matrix
+            for matrix in self.edge_matrices.values()
+            if not any(matrix is known for known in automaton.matrices)
+        }
+        return (
+            automaton.nbytes()
+            + sum(matrix_nbytes(matrix) for matrix in matrices.values())
+            + self.marked_start.nbytes
+            + self.marked_final.nbytes
+            + sys.getsizeof(automaton.states)
+            + sys.getsizeof(automaton.state_id)
+        )
+
+
+# LRU of graph matrices keyed by content digests of the graphs. An entry
+# keeps the edge list it was built from, and a hit is returned only if
+# that edge list equals the one of the graph. Entries are evicted from the
+# least recently used until all of them fit into the memory budget; a
+# graph larger than the whole budget is not kept at all.
+#
+# Looking up a plain networkx graph costs a pass over all of its edges,
+# the same as collecting them for a build. FingerprintedGraph and
+# StoredGraph are remembered by the cache with their version, so their
+# repeated lookups take no pass at all; queries over one graph should use
+# either of them
+class GraphCache:
+    def __init__(self, memory_budget: int = DEFAULT_MEMORY_BUDGET):
+        self.memory_budget = memory_budget
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[bytes, tuple[GraphEdges, GraphMatrices]] = (
+            OrderedDict()
+        )
+        self._versions = weakref.WeakKeyDictionary()
+
+    def configure(self, memory_budget: int = None):
+        if memory_budget is not None:
+            self.memory_budget = memory_budget
+            self._evict()
+
+    @staticmethod
+    def _entry_nbytes(edges: GraphEdges, matrices: GraphMatrices) -> int:
+        return (
+            matrices.nbytes()
+            + edges.sources.nbytes
+            + edges.labels.nbytes
+            + edges.targets.nbytes
+        )
+
+    def nbytes(self) -> int:
+        return sum(self._entry_nbytes(*entry) for entry in self._entries.values())
+
+    # Cached transposes make entries grow after they are added, so sizes
+    # are taken anew on every eviction
+    def _evict(self):
+        sizes = {
+            key: self._entry_nbytes(*entry) for key, entry in self._entries.items()
+        }
+        total = sum(sizes.values())
+        while self._entries and total > self.memory_budget:
+            key, _ = self._entries.popitem(last=False)
+            total -= sizes[key]
+
+    def _hit(self, key: bytes) -> GraphMatrices:
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return self._entries[key][1]
+
+    # The edge list of the graph is collected once, for the digest and on
+    # a miss for build as well. Graphs with nodes that cannot be pickled
+    # are built every time
+    def get(
+        self,
+        graph: nx.DiGraph | StoredGraph,
+        build: Callable[[GraphEdges], GraphMatrices],
+    ) -> GraphMatrices:
+        version = graph_version(graph)
+        if version is not None:
+            known = self._versions.get(graph)
+            if known is not None and known[0] == version and known[1] in self._entries:
+                return self._hit(known[1])
+
+        edges = graph_edges(graph)
+        key = edges_fingerprint(edges)
+        entry = self._entries.get(key)
+        if entry is not None and _same_edges(entry[0], edges):
+            matrices = self._hit(key)
+        else:
+            self.misses += 1
+            matrices = build(edges)
+            if key is None:
+                return matrices
+            self._entries[key] = (edges, matrices)
+            self._entries.move_to_end(key)
+            self._evict()
+
+        if version is not None:
+            self._versions[graph] = (version, key)
+        return matrices
+
+    def cache_info(self) -> GraphCacheInfo:
+        return GraphCacheInfo(
+            self.hits,
+            self.misses,
+            self.memory_budget,
+            len(self._entries),
+            self.nbytes(),
+        )
+
+    def cache_clear(self):
+        self._entries.clear()
+        self._versions.clear()
+        self.hits = self.misses = 0
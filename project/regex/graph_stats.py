@@ -0,0 +1,116 @@
+import json
+import os
+from collections import Counter, namedtuple
+
+import numpy as np
+
+from project.regex.graph_store import StoredGraph, read_edge_csv
+
+
+# Statistics of a dataset graph. labels are sorted as by
+# cfpq_data.get_sorted_labels: by number of edges, then by label. The i-th
+# entry of a degree histogram is the number of nodes of degree i
+GraphStats = namedtuple(
+    "GraphStats",
+    [
+        "number_of_nodes",
+        "number_of_edges",
+        "labels",
+        "label_counts",
+        "out_degree_histogram",
+        "in_degree_histogram",
+        "self_loops",
+    ],
+)
+
+# Edges read at once, from the CSV or the arrays of a store
+STATS_CHUNK_SIZE = 1 << 20
+
+
+def _graph_stats(
+    number_of_edges: int,
+    label_counts: dict,
+    out_degrees: np.ndarray,
+    in_degrees: np.ndarray,
+    self_loops: int,
+) -> GraphStats:
+    label_counts = dict(sorted(label_counts.items(), key=lambda x: (-x[1], x[0])))
+    return GraphStats(
+        len(out_degrees),
+        number_of_edges,
+        list(label_counts),
+        label_counts,
+        np.bincount(out_degrees).tolist(),
+        np.bincount(in_degrees).tolist(),
+        self_loops,
+    )
+
+
+# One pass over the CSV in chunks: only the per-node degrees are kept, the
+# edges are never held all at once
+def csv_stats(
+    path: str | os.PathLike, chunk_size: int = STATS_CHUNK_SIZE
+) -> GraphStats:
+    out_degrees, in_degrees, labels = Counter(), Counter(), Counter()
+    edges = self_loops = 0
+
+    with read_edge_csv(path, chunksize=chunk_size) as chunks:
+        for chunk in chunks:
+            edges += len(chunk)
+            self_loops += int((chunk["from"] == chunk["to"]).sum())
+            out_degrees.update(chunk["from"].value_counts().to_dict())
+            in_degrees.update(chunk["to"].value_counts().to_dict())
+            labels.update(chunk["label"].value_counts().to_dict())
+
+    nodes = out_degrees.keys() | in_degrees.keys()
+    return _graph_stats(
+        edges,
+        dict(labels),
+        np.fromiter((out_degrees[node] for node in nodes), np.int64, len(nodes)),
+        np.fromiter((in_degrees[node] for node in nodes), np.int64, len(nodes)),
+        self_loops,
+    )
+
+
+def store_stats(graph: StoredGraph, chunk_size: int = STATS_CHUNK_SIZE) -> GraphStats:
+    number_of_nodes = graph.number_of_nodes()
+    out_degrees = np.zeros(number_of_nodes, dtype=np.int64)
+    in_degrees = np.zeros(number_of_nodes, dtype=np.int64)
+    label_counts = np.zeros(len(graph.symbols), dtype=np.int64)
+    self_loops = 0
+
+    for begin in range(0, graph.number_of_edges(), chunk_size):
+        sources = np.asarray(graph.sources[begin : begin + chunk_size])
+        targets = np.asarray(graph.targets[begin : begin + chunk_size])
+        labels = np.asarray(graph.labels[begin : begin + chunk_size])
+        out_degrees += np.bincount(sources, minlength=number_of_nodes)
+        in_degrees += np.bincount(targets, minlength=number_of_nodes)
+        label_counts += np.bincount(labels[labels >= 0], minlength=len(graph.symbols))
+        self_loops += int((sources == targets).sum())
+
+    return _graph_stats(
+        graph.number_of_edges(),
+        dict(zip(graph.symbols, label_counts.tolist())),
+        out_degrees,
+        in_degrees,
+        self_loops,
+    )
+
+
+# Labels may be numbers, so the label counts are stored as pairs rather
+# than as a JSON object
+def save_stats(stats: GraphStats, path: str | os.PathLike):
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "w") as file:
+        json.dump(
+            {**stats._asdict(), "label_counts": list(stats.label_counts.items())},
+            file,
+        )
+    os.replace(temporary, path)
+
+
+def load_stats(path: str | os.PathLike) -> GraphStats:
+    with open(path) as file:
+        data = json.load(file)
+    data["label_counts"] = dict(map(tuple, data["label_counts"]))
+    return GraphStats(**data)
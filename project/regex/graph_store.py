@@ -0,0 +1,166 @@
+import os
+from pathlib import Path
+
+import cfpq_data as cfpq
+import networkx as nx
+import numpy as np
+import pandas as pd
+
+from project.regex.fa_storage import load_arrays, save_arrays
+
+
+# A graph store is a file in the layout of project.regex.fa_storage with the
+# node and label tables in the header and the edges as arrays of node and
+# label ids. Integer nodes are an array as well
+STORE_MAGIC = b"CFGS"
+STORE_FORMAT_VERSION = 1
+STORE_SUFFIX = ".graph"
+
+
+def graph_store_path(name: str, store_dir: str | os.PathLike = None) -> Path:
+    return Path(store_dir if store_dir is not None else cfpq.GRAPHS_DIR) / (
+        name + STORE_SUFFIX
+    )
+
+
+# Edge lists of the dataset: "source target label" per line, read the way
+# cfpq_data.graph_from_csv reads them
+def read_edge_csv(path: str | os.PathLike, **options) -> pd.DataFrame:
+    return pd.read_csv(
+        path,
+        sep=" ",
+        header=None,
+        names=["from", "to", "label"],
+        engine="c",
+        **options,
+    )
+
+
+def _id_dtype(size: int) -> np.dtype:
+    return np.dtype(np.int32 if size < 2**31 else np.int64)
+
+
+# Nodes are numbered in the order they first appear, as graph_from_csv adds
+# them. Edges without a label get label id -1
+def convert_csv(csv_path: str | os.PathLike, store_path: str | os.PathLike):
+    data = read_edge_csv(csv_path)
+    ends = np.column_stack([data["from"].to_numpy(), data["to"].to_numpy()])
+    node_ids, nodes = pd.factorize(ends.ravel())
+    label_ids, symbols = pd.factorize(data["label"])
+    node_ids = node_ids.reshape(-1, 2)
+
+    header = {"symbols": symbols.tolist()}
+    arrays = {
+        "sources": node_ids[:, 0].astype(_id_dtype(len(nodes))),
+        "targets": node_ids[:, 1].astype(_id_dtype(len(nodes))),
+        "labels": label_ids.astype(_id_dtype(len(symbols))),
+    }
+    if np.issubdtype(nodes.dtype, np.integer):
+        arrays["nodes"] = np.asarray(nodes, dtype=np.int64)
+    else:
+        header["nodes"] = nodes.tolist()
+
+    temporary = f"{store_path}.{os.getpid()}.tmp"
+    save_arrays(temporary, STORE_MAGIC, STORE_FORMAT_VERSION, header, arrays)
+    os.replace(temporary, store_path)
+
+
+# Read-only graph over the arrays of a store. Node and edge counts,
+# iteration over nodes and membership are answered from the arrays;
+# everything else of the networkx API is forwarded to a frozen MultiDiGraph
+# built on first use, so the arrays and the graph never disagree
+class StoredGraph:
+    __slots__ = (
+        "node_values",
+        "sources",
+        "targets",
+        "labels",
+        "symbols",
+        "_node_id",
+        "_networkx",
+        "__weakref__",
+    )
+
+    def __init__(
+        self,
+        node_values: np.ndarray,
+        sources: np.ndarray,
+        targets: np.ndarray,
+        labels: np.ndarray,
+        symbols: list,
+    ):
+        self.node_values = node_values
+        self.sources = sources
+        self.targets = targets
+        self.labels = labels
+        self.symbols = symbols
+        self._node_id = None
+        self._networkx = None
+
+    def number_of_nodes(self) -> int:
+        return len(self.node_values)
+
+    def number_of_edges(self) -> int:
+        return len(self.sources)
+
+    @property
+    def node_id(self) -> dict:
+        if self._node_id is None:
+            self._node_id = {
+                node: i for i, node in enumerate(self.node_values.tolist())
+            }
+        return self._node_id
+
+    def __len__(self) -> int:
+        return self.number_of_nodes()
+
+    def __iter__(self):
+        return iter(self.node_values.tolist())
+
+    def __contains__(self, node) -> bool:
+        try:
+            return node in self.node_id
+        except TypeError:
+            return False
+
+    def __getitem__(self, node):
+        return self.to_networkx()[node]
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.to_networkx(), name)
+
+    def to_networkx(self) -> nx.MultiDiGraph:
+        if self._networkx is None:
+            nodes = self.node_values.tolist()
+            symbols = self.symbols
+            graph = nx.MultiDiGraph()
+            graph.add_nodes_from(nodes)
+            graph.add_edges_from(
+                (nodes[u], nodes[v], {"label": symbols[label]} if label >= 0 else {})
+                for u, v, label in zip(
+                    self.sources.tolist(), self.targets.tolist(), self.labels.tolist()
+                )
+            )
+            self._networkx = nx.freeze(graph)
+        return self._networkx
+
+
+def open_graph_store(path: str | os.PathLike, mmap: bool = True) -> StoredGraph:
+    header, arrays = load_arrays(
+        path, STORE_MAGIC, STORE_FORMAT_VERSION, "graph store", mmap
+    )
+    if "nodes" in arrays:
+        node_values = arrays["nodes"]
+    else:
+        node_values = np.empty(len(header["nodes"]), dtype=object)
+        node_values[:] = header["nodes"]
+
+    return StoredGraph(
+        node_values,
+        arrays["sources"],
+        arrays["targets"],
+        arrays["labels"],
+        header["symbols"],
+    )
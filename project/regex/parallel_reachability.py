@@ -0,0 +1,252 @@
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import networkx as nx
+import numpy as np
+from pyformlang.finite_automaton import Symbol
+from scipy.sparse import csr_matrix
+
+from project.regex.adjacency_matrix_fa import AdjacencyMatrixFA
+from project.regex.bit_matrix import to_backend
+from project.regex.create_finite_automaton import graph_to_matrix_fa
+from project.regex.glushkov import regex_to_matrix_fa
+from project.regex.pruning import pruned_query_arrays, regex_alphabet
+from project.regex.reachability import (
+    DEFAULT_CHUNK_SIZE,
+    block_regex_matrices,
+    ms_bfs,
+)
+
+
+# Every array starts at a multiple of ALIGNMENT bytes of the shared block
+ALIGNMENT = 64
+
+# Start nodes are split into about this many chunks per worker, so that
+# workers that finish early take over the remaining ones
+CHUNKS_PER_WORKER = 4
+
+
+def _aligned(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+# Named arrays packed into one shared memory block. The layout is a small
+# picklable dict, so workers attach to the block instead of receiving copies
+def share_arrays(arrays: dict[str, np.ndarray]) -> tuple[SharedMemory, dict]:
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        layout[name] = (offset, array.dtype.str, len(array))
+        offset = _aligned(offset + array.nbytes)
+
+    memory = SharedMemory(create=True, size=max(offset, 1))
+    for name, array in arrays.items():
+        view = _view(memory, layout[name])
+        view[:] = array
+
+    return memory, layout
+
+
+def _view(memory: SharedMemory, entry: tuple[int, str, int]) -> np.ndarray:
+    offset, dtype, length = entry
+    return np.ndarray(
+        (length,), dtype=np.dtype(dtype), buffer=memory.buf, offset=offset
+    )
+
+
+# Only the driver owns the block: before Python 3.13 the resource tracker
+# of a worker would unlink it when the worker exits
+def _attach(name: str) -> SharedMemory:
+    try:
+        return SharedMemory(name=name, track=False)
+    except TypeError:
+        memory = SharedMemory(name=name)
+        resource_tracker.unregister(memory._name, "shared_memory")
+        return memory
+
+
+def _fa_arrays(prefix: str, fa: AdjacencyMatrixFA, labels: list[int]) -> dict:
+    arrays = {
+        f"{prefix}_start_ids": np.asarray(fa.start_ids, dtype=np.int64),
+        f"{prefix}_final_ids": np.asarray(fa.final_ids, dtype=np.int64),
+    }
+    matrices = fa.matrices
+    for i, label in enumerate(labels):
+        matrix = to_backend(matrices[label], "sparse").tocsr()
+        arrays[f"{prefix}_indptr_{i}"] = matrix.indptr
+        arrays[f"{prefix}_indices_{i}"] = matrix.indices
+    return arrays
+
+
+# Automaton over the shared arrays: states are ids only and the i-th symbol
+# is the i-th shared label, which is all ms_bfs needs
+def _shared_fa(
+    memory: SharedMemory,
+    layout: dict,
+    prefix: str,
+    number_of_states: int,
+    number_of_labels: int,
+) -> AdjacencyMatrixFA:
+    fa = AdjacencyMatrixFA()
+    fa.number_of_states = number_of_states
+    fa.states = range(number_of_states)
+    fa.start_ids = _view(memory, layout[f"{prefix}_start_ids"])
+    fa.final_ids = _view(memory, layout[f"{prefix}_final_ids"])
+    ones = _view(memory, layout["ones"])
+
+    shape = (number_of_states, number_of_states)
+    for i in range(number_of_labels):
+        indices = _view(memory, layout[f"{prefix}_indices_{i}"])
+        indptr = _view(memory, layout[f"{prefix}_indptr_{i}"])
+        matrix = csr_matrix(
+            (ones[: len(indices)], indices, indptr),
+            shape=shape,
+            copy=False,
+        )
+        fa.set_symbol_matrix(Symbol(i), matrix)
+
+    return fa
+
+
+# Per-process state of a worker: the attached block, both automata and the
+# block-diagonal regex matrices for every chunk size seen so far
+_worker: dict = {}
+
+
+def _init_worker(
+    name: str,
+    layout: dict,
+    number_of_regex_states: int,
+    number_of_graph_states: int,
+    number_of_labels: int,
+):
+    memory = _attach(name)
+    _worker["memory"] = memory
+    _worker["regex_fa"] = _shared_fa(
+        memory, layout, "regex", number_of_regex_states, number_of_labels
+    )
+    _worker["graph_fa"] = _shared_fa(
+        memory, layout, "graph", number_of_graph_states, number_of_labels
+    )
+    _worker["labels"] = [(i, i) for i in range(number_of_labels)]
+    _worker["block_matrices"] = {}
+
+
+def _run_chunk(start_ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    regex_fa, graph_fa, labels = (
+        _worker["regex_fa"],
+        _worker["graph_fa"],
+        _worker["labels"],
+    )
+    block_matrices = _worker["block_matrices"].get(len(start_ids))
+    if block_matrices is None:
+        block_matrices = block_regex_matrices(regex_fa, len(start_ids), labels)
+        _worker["block_matrices"][len(start_ids)] = block_matrices
+
+    return ms_bfs(regex_fa, graph_fa, start_ids, labels, block_matrices)
+
+
+# ms-BFS with the start nodes split into chunks over a process pool. The
+# matrices of the shared labels live in one shared memory block that every
+# worker maps, and the driver merges the (start, final) pairs of the chunks
+def parallel_ms_bfs_based_rpq_arrays(
+    regex: str,
+    graph: nx.MultiDiGraph,
+    start_nodes: set[int] = None,
+    final_nodes: set[int] = None,
+    regex_mode: str = "auto",
+    max_workers: int = None,
+    chunk_size: int = None,
+    prune: bool = False,
+) -> tuple[np.ndarray, np.ndarray]:
+    if prune:
+        return pruned_query_arrays(
+            parallel_ms_bfs_based_rpq_arrays,
+            regex,
+            regex_alphabet(regex, regex_mode),
+            graph,
+            start_nodes,
+            final_nodes,
+            regex_mode,
+            max_workers,
+            chunk_size,
+        )
+
+    regex_fa = regex_to_matrix_fa(regex, regex_mode)
+    graph_nfa = graph_to_matrix_fa(graph, start_nodes, final_nodes)
+
+    max_workers = max_workers or os.cpu_count() or 1
+    start_ids = graph_nfa.start_ids
+    if chunk_size is None:
+        chunk_size = min(
+            DEFAULT_CHUNK_SIZE,
+            max(1, math.ceil(len(start_ids) / (max_workers * CHUNKS_PER_WORKER))),
+        )
+    if chunk_size < 1:
+        raise ValueError(f"Chunk size must be positive, got {chunk_size}")
+
+    labels = regex_fa.shared_labels(graph_nfa)
+    arrays = {
+        **_fa_arrays("regex", regex_fa, [label for label, _ in labels]),
+        **_fa_arrays("graph", graph_nfa, [label for _, label in labels]),
+    }
+    # The values of every matrix are views of one shared array of ones
+    arrays["ones"] = np.ones(
+        max(
+            (len(array) for name, array in arrays.items() if "indices" in name),
+            default=0,
+        ),
+        dtype=bool,
+    )
+    memory, layout = share_arrays(arrays)
+
+    try:
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_worker,
+            initargs=(
+                memory.name,
+                layout,
+                regex_fa.number_of_states,
+                graph_nfa.number_of_states,
+                len(labels),
+            ),
+        ) as executor:
+            results = list(
+                executor.map(
+                    _run_chunk,
+                    [
+                        start_ids[begin : begin + chunk_size]
+                        for begin in range(0, len(start_ids), chunk_size)
+                    ],
+                )
+            )
+    finally:
+        memory.close()
+        memory.unlink()
+
+    if not results:
+        return graph_nfa.state_pairs(np.zeros(0, np.int64), np.zeros(0, np.int64))
+
+    return graph_nfa.state_pairs(
+        np.concatenate([starts for starts, _ in results]),
+        np.concatenate([finals for _, finals in results]),
+    )
+
+
+def parallel_ms_bfs_based_rpq(
+    regex: str,
+    graph: nx.MultiDiGraph,
+    start_nodes: set[int] = None,
+    final_nodes: set[int] = None,
+    regex_mode: str = "auto",
+    max_workers: int = None,
+    prune: bool = False,
+) -> set[tuple[int, int]]:
+    starts, finals = parallel_ms_bfs_based_rpq_arrays(
+        regex, graph, start_nodes, final_nodes, regex_mode, max_workers, prune=prune
+    )
+    return set(zip(starts.tolist(), finals.tolist()))
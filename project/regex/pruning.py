@@ -0,0 +1,158 @@
+from collections import namedtuple
+from typing import Callable, Iterable
+
+import networkx as nx
+import numpy as np
+from pyformlang.cfg import CFG
+from pyformlang.rsa import RecursiveAutomaton
+from scipy.sparse import coo_matrix, csr_matrix
+
+from project.regex.adjacency_matrix_fa import value_array
+from project.regex.closure import reachable_from
+from project.regex.create_finite_automaton import EPSILON_LABELS
+from project.regex.glushkov import compile_regex
+
+
+# The pruned graph has nodes 0..k-1, nodes[i] is the original node of i.
+# start_nodes and final_nodes are renumbered the same way, both are empty
+# if they were not given
+PrunedGraph = namedtuple(
+    "PrunedGraph", ["graph", "nodes", "start_nodes", "final_nodes", "empty"]
+)
+
+
+# Labels a query can follow. Epsilon edges of the graph are always kept
+def regex_alphabet(regex: str, regex_mode: str = "auto") -> set:
+    return set(compile_regex(regex, regex_mode).symbols) | set(EPSILON_LABELS)
+
+
+def cfg_alphabet(cfg: CFG) -> set:
+    return {terminal.value for terminal in cfg.terminals} | set(EPSILON_LABELS)
+
+
+def rsm_alphabet(rsm: RecursiveAutomaton) -> set:
+    symbols = {symbol.value for box in rsm.boxes.values() for symbol in box.dfa.symbols}
+    nonterminals = {label.value for label in rsm.boxes}
+    return (symbols - nonterminals) | set(EPSILON_LABELS)
+
+
+def _reachable(adjacency: csr_matrix, sources: np.ndarray) -> np.ndarray:
+    row = csr_matrix(sources.reshape(1, -1))
+    return reachable_from(adjacency, row).toarray().ravel()
+
+
+# Keeping only the edges with a label of the alphabet and the nodes that
+# are reachable from a start node and reach a final node over them. Nodes
+# marked is_start / is_final count as start and final nodes, as they do
+# for graph_to_nfa; start and final nodes outside the graph are kept as
+# isolated nodes
+def prune_graph(
+    graph: nx.MultiDiGraph,
+    alphabet: Iterable,
+    start_nodes: set = None,
+    final_nodes: set = None,
+) -> PrunedGraph:
+    alphabet = set(alphabet)
+    nodes = list(graph.nodes)
+    for node in [*(start_nodes or ()), *(final_nodes or ())]:
+        if node not in graph:
+            nodes.append(node)
+    node_id = {node: i for i, node in enumerate(nodes)}
+
+    edges = [
+        (node_id[u], node_id[v], label)
+        for u, v, label in graph.edges(data="label")
+        if label in alphabet
+    ]
+    sources = np.fromiter((u for u, _, _ in edges), dtype=np.int64, count=len(edges))
+    targets = np.fromiter((v for _, v, _ in edges), dtype=np.int64, count=len(edges))
+    adjacency = coo_matrix(
+        (np.ones(len(edges), dtype=bool), (sources, targets)),
+        shape=(len(nodes), len(nodes)),
+    ).tocsr()
+
+    def marked(nodes_given: set, attribute: str) -> np.ndarray:
+        if not nodes_given:
+            return np.ones(len(nodes), dtype=bool)
+        mask = np.zeros(len(nodes), dtype=bool)
+        mask[[node_id[node] for node in nodes_given]] = True
+        for node, value in graph.nodes(data=attribute):
+            if value:
+                mask[node_id[node]] = True
+        return mask
+
+    keep = _reachable(adjacency, marked(start_nodes, "is_start")) & _reachable(
+        adjacency.T.tocsr(), marked(final_nodes, "is_final")
+    )
+    kept = np.flatnonzero(keep)
+    new_id = np.full(len(nodes), -1, dtype=np.int64)
+    new_id[kept] = np.arange(len(kept))
+
+    pruned = nx.MultiDiGraph()
+    pruned.add_nodes_from(
+        (int(new_id[i]), graph.nodes[nodes[i]] if nodes[i] in graph else {})
+        for i in kept.tolist()
+    )
+    pruned.add_edges_from(
+        (int(new_id[u]), int(new_id[v]), {"label": label})
+        for u, v, label in edges
+        if keep[u] and keep[v]
+    )
+
+    def renumbered(nodes_given: set) -> set[int]:
+        return {
+            int(new_id[node_id[node]])
+            for node in nodes_given or ()
+            if keep[node_id[node]]
+        }
+
+    pruned_start, pruned_final = renumbered(start_nodes), renumbered(final_nodes)
+    return PrunedGraph(
+        pruned,
+        value_array([nodes[i] for i in kept.tolist()]),
+        pruned_start,
+        pruned_final,
+        len(kept) == 0
+        or (bool(start_nodes) and not pruned_start)
+        or (bool(final_nodes) and not pruned_final),
+    )
+
+
+# Running an engine on the pruned graph and mapping its answer back to the
+# original nodes
+def pruned_query(
+    engine: Callable[..., set[tuple]],
+    query,
+    alphabet: Iterable,
+    graph: nx.MultiDiGraph,
+    start_nodes: set = None,
+    final_nodes: set = None,
+    *args,
+) -> set[tuple]:
+    pruned = prune_graph(graph, alphabet, start_nodes, final_nodes)
+    if pruned.empty:
+        return set()
+
+    pairs = engine(query, pruned.graph, pruned.start_nodes, pruned.final_nodes, *args)
+    nodes = pruned.nodes.tolist()
+    return {(nodes[u], nodes[v]) for u, v in pairs}
+
+
+# The same for engines answering with arrays of start and final nodes
+def pruned_query_arrays(
+    engine: Callable[..., tuple[np.ndarray, np.ndarray]],
+    query,
+    alphabet: Iterable,
+    graph: nx.MultiDiGraph,
+    start_nodes: set = None,
+    final_nodes: set = None,
+    *args,
+) -> tuple[np.ndarray, np.ndarray]:
+    pruned = prune_graph(graph, alphabet, start_nodes, final_nodes)
+    if pruned.empty:
+        return pruned.nodes[:0], pruned.nodes[:0]
+
+    starts, finals = engine(
+        query, pruned.graph, pruned.start_nodes, pruned.final_nodes, *args
+    )
+    return pruned.nodes[starts], pruned.nodes[finals]
@@ -1,93 +1,230 @@
+from typing import Iterator
+
 import networkx as nx
 import numpy as np
 
-from scipy.sparse import csr_matrix
-from pyformlang.finite_automaton import Symbol
+from scipy.sparse import coo_matrix, csr_matrix, identity, kron
 
 from project.regex.adjacency_matrix_fa import AdjacencyMatrixFA
-from project.regex.create_finite_automaton import regex_to_dfa, graph_to_nfa
+from project.regex.closure import difference
+from project.regex.create_finite_automaton import graph_to_matrix_fa
+from project.regex.glushkov import regex_to_matrix_fa
+from project.regex.pruning import pruned_query_arrays, regex_alphabet
 
 
-def front(regex_fa: AdjacencyMatrixFA, graph_fa: AdjacencyMatrixFA) -> csr_matrix:
-    current_front = csr_matrix(
-        (
-            regex_fa.number_of_states * len(graph_fa.start_states),
+# Block i of the front holds the regex states for the i-th start node,
+# given by its graph id
+def front(
+    regex_fa: AdjacencyMatrixFA, graph_fa: AdjacencyMatrixFA, start_ids: np.ndarray
+) -> csr_matrix:
+    number_of_starts = len(start_ids)
+    number_of_regex_starts = len(regex_fa.start_ids)
+
+    rows = np.repeat(
+        np.arange(number_of_starts), number_of_regex_starts
+    ) * regex_fa.number_of_states + np.tile(regex_fa.start_ids, number_of_starts)
+    cols = np.repeat(start_ids, number_of_regex_starts)
+
+    return coo_matrix(
+        (np.ones(len(rows), dtype=bool), (rows, cols)),
+        shape=(
+            regex_fa.number_of_states * number_of_starts,
             graph_fa.number_of_states,
-        )
-    )
+        ),
+    ).tocsr()
 
-    graph_start_states = {
-        state
-        for state, _ in sorted(
-            graph_fa.start_states_id.items(), key=lambda item: item[1]
-        )
-    }
-    for i, graph_state in enumerate(graph_start_states):
-        for regex_state in regex_fa.start_states:
-            regex_fa_state = (
-                regex_fa.state_id[regex_state] + i * regex_fa.number_of_states
-            )
-            graph_fa_state = graph_fa.state_id[graph_state]
-            current_front[regex_fa_state, graph_fa_state] = True
 
-    return current_front
+# Regex matrices of the shared labels, transposed and repeated on the
+# diagonal once per start block, so that a single product moves the regex
+# states of all blocks
+def block_regex_matrices(
+    regex_fa: AdjacencyMatrixFA,
+    number_of_blocks: int,
+    labels: list[tuple[int, int]],
+) -> list[csr_matrix]:
+    blocks = identity(number_of_blocks, dtype=bool, format="csr")
+    regex_matrices = regex_fa.matrices
+    return [
+        kron(blocks, regex_matrices[regex_label].T, format="csr")
+        for regex_label, _ in labels
+    ]
 
 
 def create_next_front(
     current_front: csr_matrix,
+    block_matrices: list[csr_matrix],
+    graph_fa: AdjacencyMatrixFA,
+    labels: list[tuple[int, int]],
+) -> csr_matrix:
+    graph_matrices = graph_fa.matrices
+    next_front = csr_matrix(current_front.shape, dtype=bool)
+
+    for block_matrix, (_, graph_label) in zip(block_matrices, labels):
+        next_front += block_matrix @ (current_front @ graph_matrices[graph_label])
+
+    return next_front
+
+
+# Multi-source BFS from the given graph start ids, block_matrices having
+# one block per start. Returns the visited matrix in the layout of front
+def ms_bfs_visited(
     regex_fa: AdjacencyMatrixFA,
     graph_fa: AdjacencyMatrixFA,
-    symbols: set[Symbol],
+    start_ids: np.ndarray,
+    labels: list[tuple[int, int]],
+    block_matrices: list[csr_matrix],
 ) -> csr_matrix:
-    number_of_states = regex_fa.number_of_states
+    # Every level expands only the newly reached states
+    current_front = front(regex_fa, graph_fa, start_ids)
+    visited = current_front
+    while current_front.nnz > 0:
+        next_front = create_next_front(current_front, block_matrices, graph_fa, labels)
+        current_front = difference(next_front, visited)
+        visited = visited + current_front
 
-    for s in symbols:
-        next_front = current_front @ graph_fa.decomposition[s]
-        for i in range(len(graph_fa.start_states)):
-            indices = np.arange(i * number_of_states, (i + 1) * number_of_states)
-            next_front[indices] = regex_fa.decomposition[s].T @ next_front[indices]
-        current_front += next_front
+    return visited
 
-    return current_front
 
+# The reached (start id, final id) pairs: rows of the given regex final
+# states in every block, columns of the graph final nodes
+def final_pairs(
+    visited: csr_matrix,
+    number_of_states: int,
+    regex_final_ids: np.ndarray,
+    start_ids: np.ndarray,
+    graph_final_ids: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray]:
+    blocks = np.arange(len(start_ids))
+    rows = (blocks[:, None] * number_of_states + regex_final_ids[None, :]).ravel()
+    found = visited[rows][:, graph_final_ids].tocoo()
 
-def ms_bfs_based_rpq(
+    return start_ids[rows[found.row] // number_of_states], graph_final_ids[found.col]
+
+
+def ms_bfs(
+    regex_fa: AdjacencyMatrixFA,
+    graph_fa: AdjacencyMatrixFA,
+    start_ids: np.ndarray,
+    labels: list[tuple[int, int]],
+    block_matrices: list[csr_matrix],
+) -> tuple[np.ndarray, np.ndarray]:
+    visited = ms_bfs_visited(regex_fa, graph_fa, start_ids, labels, block_matrices)
+    return final_pairs(
+        visited,
+        regex_fa.number_of_states,
+        regex_fa.final_ids,
+        start_ids,
+        graph_fa.final_ids,
+    )
+
+
+# Worst-case memory of one start block: the front, the next front, the
+# visited matrix and a product may all hold every (regex state, graph node)
+# entry as a bool and an int32 index
+LIVE_MATRICES = 4
+ENTRY_BYTES = 5
+
+DEFAULT_CHUNK_SIZE = 1024
+
+
+def chunk_size_for_budget(
+    regex_fa: AdjacencyMatrixFA, graph_fa: AdjacencyMatrixFA, memory_budget: int
+) -> int:
+    block_bytes = (
+        LIVE_MATRICES
+        * ENTRY_BYTES
+        * regex_fa.number_of_states
+        * graph_fa.number_of_states
+    )
+    return max(1, memory_budget // max(block_bytes, 1))
+
+
+# The answer in chunks of at most chunk_size start nodes, every chunk is
+# yielded as arrays of start and final nodes as soon as its BFS finishes.
+# With memory_budget in bytes the chunk size is derived from the worst-case
+# size of a start block
+def ms_bfs_based_rpq_chunks(
     regex: str,
     graph: nx.MultiDiGraph,
     start_nodes: set[int] = None,
     final_nodes: set[int] = None,
-) -> set[tuple[int, int]]:
-    regex_dfa = AdjacencyMatrixFA(regex_to_dfa(regex))
-    graph_nfa = AdjacencyMatrixFA(graph_to_nfa(graph, start_nodes, final_nodes))
+    regex_mode: str = "auto",
+    chunk_size: int = None,
+    memory_budget: int = None,
+) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    regex_fa = regex_to_matrix_fa(regex, regex_mode)
+    graph_nfa = graph_to_matrix_fa(graph, start_nodes, final_nodes)
+
+    if chunk_size is None:
+        chunk_size = (
+            DEFAULT_CHUNK_SIZE
+            if memory_budget is None
+            else chunk_size_for_budget(regex_fa, graph_nfa, memory_budget)
+        )
+    if chunk_size < 1:
+        raise ValueError(f"Chunk size must be positive, got {chunk_size}")
+
+    start_ids = graph_nfa.start_ids
+    if len(start_ids) == 0:
+        return
+
+    labels = regex_fa.shared_labels(graph_nfa)
+    chunk_size = min(chunk_size, len(start_ids))
+    block_matrices = block_regex_matrices(regex_fa, chunk_size, labels)
+
+    for begin in range(0, len(start_ids), chunk_size):
+        chunk = start_ids[begin : begin + chunk_size]
+        if len(chunk) < chunk_size:
+            size = len(chunk) * regex_fa.number_of_states
+            block_matrices = [matrix[:size, :size] for matrix in block_matrices]
+        yield graph_nfa.state_pairs(
+            *ms_bfs(regex_fa, graph_nfa, chunk, labels, block_matrices)
+        )
 
-    symbols = set(regex_dfa.decomposition.keys()).intersection(
-        graph_nfa.decomposition.keys()
-    )
 
-    current_front = front(regex_dfa, graph_nfa)
-    visited = current_front
-    while current_front.size > 0:
-        next_front = create_next_front(current_front, regex_dfa, graph_nfa, symbols)
-        current_front = next_front > visited
-        visited += current_front
-
-    pairs = set()
-    graph_start_states = {
-        state
-        for state, _ in sorted(
-            graph_nfa.start_states_id.items(), key=lambda item: item[1]
+# The answer as two aligned arrays of start and final nodes, so that large
+# answers are never turned into Python tuples
+# With prune=True the query runs on the graph cut down to the regex labels
+# and the nodes between the start and final nodes, see prune_graph
+def ms_bfs_based_rpq_arrays(
+    regex: str,
+    graph: nx.MultiDiGraph,
+    start_nodes: set[int] = None,
+    final_nodes: set[int] = None,
+    regex_mode: str = "auto",
+    prune: bool = False,
+) -> tuple[np.ndarray, np.ndarray]:
+    if prune:
+        return pruned_query_arrays(
+            ms_bfs_based_rpq_arrays,
+            regex,
+            regex_alphabet(regex, regex_mode),
+            graph,
+            start_nodes,
+            final_nodes,
+            regex_mode,
         )
-    }
-    graph_dict = {v: k for k, v in graph_nfa.state_id.items()}
-
-    for i, graph_start in enumerate(graph_start_states):
-        start = i * regex_dfa.number_of_states
-        end = (i + 1) * regex_dfa.number_of_states
-        for regex_final in regex_dfa.final_states:
-            for visit_i in (
-                visited[start:end].getrow(regex_dfa.state_id[regex_final]).indices
-            ):
-                if graph_dict[visit_i] in graph_nfa.final_states:
-                    pairs.add((graph_start, graph_dict[visit_i]))
-
-    return pairs
+
+    regex_fa = regex_to_matrix_fa(regex, regex_mode)
+    graph_nfa = graph_to_matrix_fa(graph, start_nodes, final_nodes)
+
+    labels = regex_fa.shared_labels(graph_nfa)
+    block_matrices = block_regex_matrices(regex_fa, len(graph_nfa.start_ids), labels)
+
+    return graph_nfa.state_pairs(
+        *ms_bfs(regex_fa, graph_nfa, graph_nfa.start_ids, labels, block_matrices)
+    )
+
+
+def ms_bfs_based_rpq(
+    regex: str,
+    graph: nx.MultiDiGraph,
+    start_nodes: set[int] = None,
+    final_nodes: set[int] = None,
+    regex_mode: str = "auto",
+    prune: bool = False,
+) -> set[tuple[int, int]]:
+    starts, finals = ms_bfs_based_rpq_arrays(
+        regex, graph, start_nodes, final_nodes, regex_mode, prune
+    )
+    return set(zip(starts.tolist(), finals.tolist()))
@@ -0,0 +1,180 @@
+import hashlib
+import os
+import re
+from collections import OrderedDict, namedtuple
+from typing import Callable
+
+import numpy as np
+import pyformlang.finite_automaton as fa
+
+
+CacheInfo = namedtuple(
+    "CacheInfo", ["hits", "disk_hits", "misses", "maxsize", "currsize"]
+)
+
+_OPERATOR_SPACES = re.compile(r"\s*([|()*])\s*")
+_SPACES = re.compile(r"\s+")
+
+
+# Whitespace runs mean a single concatenation and spaces around operators
+# and parentheses mean nothing, so such variants share one cache entry.
+# Escaped regexes are only stripped
+def normalize_regex(regex: str) -> str:
+    regex = regex.strip()
+    if "\\" in regex:
+        return regex
+    return _OPERATOR_SPACES.sub(r"\1", _SPACES.sub(" ", regex))
+
+
+# Compiled DFA as a compact integer transition table: states are 0..n-1,
+# symbols are indexed by position and start is -1 for an automaton
+# without states
+class CompiledRegex:
+    __slots__ = ("number_of_states", "start", "finals", "symbols", "transitions")
+
+    def __init__(
+        self,
+        number_of_states: int,
+        start: int,
+        finals: np.ndarray,
+        symbols: list[str],
+        transitions: np.ndarray,
+    ):
+        self.number_of_states = number_of_states
+        self.start = start
+        self.finals = finals
+        self.symbols = symbols
+        self.transitions = transitions
+
+    @classmethod
+    def from_dfa(cls, dfa: fa.DeterministicFiniteAutomaton) -> "CompiledRegex":
+        state_id = {state: i for i, state in enumerate(dfa.states)}
+        symbol_id = {symbol: i for i, symbol in enumerate(dfa.symbols)}
+        transitions = np.array(
+            [
+                (state_id[from_st], symbol_id[symbol], state_id[to_st])
+                for from_st, symbol, to_st in dfa
+            ],
+            dtype=np.int32,
+        ).reshape(-1, 3)
+
+        return cls(
+            len(state_id),
+            state_id[dfa.start_state] if dfa.start_state is not None else -1,
+            np.array(sorted(state_id[st] for st in dfa.final_states), dtype=np.int32),
+            [symbol.value for symbol in symbol_id],
+            transitions,
+        )
+
+    def to_dfa(self) -> fa.DeterministicFiniteAutomaton:
+        dfa = fa.DeterministicFiniteAutomaton()
+        symbols = [fa.Symbol(value) for value in self.symbols]
+        states = [fa.State(i) for i in range(self.number_of_states)]
+
+        for from_st, label, to_st in self.transitions.tolist():
+            dfa.add_transition(states[from_st], symbols[label], states[to_st])
+        if self.start >= 0:
+            dfa.add_start_state(states[self.start])
+        for final in self.finals.tolist():
+            dfa.add_final_state(states[final])
+
+        return dfa
+
+    def save(self, path: str, key: str):
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as file:
+            np.savez(
+                file,
+                key=np.array(key),
+                header=np.array([self.number_of_states, self.start], dtype=np.int64),
+                finals=self.finals,
+                symbols=np.array(self.symbols, dtype=str),
+                transitions=self.transitions,
+            )
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path: str, key: str) -> "CompiledRegex | None":
+        with np.load(path) as data:
+            if str(data["key"]) != key:
+                return None
+            number_of_states, start = data["header"].tolist()
+            return cls(
+                number_of_states,
+                start,
+                data["finals"],
+                data["symbols"].tolist(),
+                data["transitions"],
+            )
+
+
+# LRU of compiled regexes keyed by the kind of automaton and the normalized
+# regex, optionally backed by a directory with one file per entry that
+# outlives the process. The kind names the pipeline that compiles the
+# table as well, so tables of different compilers are never mixed
+class RegexCache:
+    def __init__(self, maxsize: int = 512, directory: str | os.PathLike = None):
+        self.maxsize = maxsize
+        self.directory = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple[str, str], CompiledRegex] = OrderedDict()
+        self.configure(maxsize, directory)
+
+    def configure(self, maxsize: int = None, directory: str | os.PathLike = None):
+        if maxsize is not None:
+            self.maxsize = maxsize
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self.directory = directory
+
+    def _path(self, key: tuple[str, str]) -> str:
+        digest = hashlib.sha256(":".join(key).encode()).hexdigest()
+        return os.path.join(self.directory, f"{digest}.npz")
+
+    def _remember(self, key: tuple[str, str], compiled: CompiledRegex):
+        self._entries[key] = compiled
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def get(
+        self,
+        regex: str,
+        compile_table: Callable[[str], CompiledRegex],
+        kind: str,
+    ) -> CompiledRegex:
+        key = (kind, normalize_regex(regex))
+
+        compiled = self._entries.get(key)
+        if compiled is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return compiled
+
+        if self.directory is not None and os.path.exists(self._path(key)):
+            compiled = CompiledRegex.load(self._path(key), ":".join(key))
+            if compiled is not None:
+                self.disk_hits += 1
+                self._remember(key, compiled)
+                return compiled
+
+        self.misses += 1
+        compiled = compile_table(key[1])
+        self._remember(key, compiled)
+        if self.directory is not None:
+            compiled.save(self._path(key), ":".join(key))
+
+        return compiled
+
+    def cache_info(self) -> CacheInfo:
+        return CacheInfo(
+            self.hits, self.disk_hits, self.misses, self.maxsize, len(self._entries)
+        )
+
+    def cache_clear(self):
+        self._entries.clear()
+        self.hits = self.disk_hits = self.misses = 0
@@ -0,0 +1,243 @@
+import inspect
+import logging
+import math
+from collections import namedtuple
+from typing import Callable
+
+import networkx as nx
+import numpy as np
+
+from project.regex import connected_vertices
+from project.regex.connected_vertices import tensor_based_rpq
+from project.regex.create_finite_automaton import graph_matrices
+from project.regex.glushkov import compile_regex
+from project.regex.parallel_reachability import parallel_ms_bfs_based_rpq
+from project.regex.reachability import ms_bfs_based_rpq
+
+
+logger = logging.getLogger(__name__)
+
+# What the cost models see of a query. product_edges is the number of edges
+# of the regex x graph product, depth the estimated number of BFS levels
+QueryStats = namedtuple(
+    "QueryStats",
+    [
+        "regex_states",
+        "regex_labels",
+        "number_of_nodes",
+        "number_of_edges",
+        "label_edges",
+        "relevant_edges",
+        "product_edges",
+        "number_of_starts",
+        "depth",
+    ],
+)
+
+
+# Costs are estimated seconds. The constants were measured on scale-free
+# and two-cycles graphs: every sparse product has a fixed call cost, a BFS
+# pays per start for every product edge it follows and for rescanning the
+# visited entries on every level, and the closure pays per product state
+# for every product edge
+PRODUCT_EDGE_COST = 1e-8
+SEARCH_EDGE_COST = 4.5e-9
+VISITED_ENTRY_COST = 1e-10
+CLOSURE_COST = 8e-9
+PRODUCT_CALL_COST = 5e-5
+
+
+# A graph of average degree d is explored in about log(n) / log(d) levels,
+# a graph of paths and cycles (d close to 1) in up to n levels. Every regex
+# state can add its own levels
+def estimate_depth(number_of_nodes: int, edges: int, regex_states: int) -> int:
+    if number_of_nodes <= 1:
+        return regex_states
+    degree = edges / number_of_nodes
+    if degree <= 1.05:
+        levels = number_of_nodes
+    else:
+        levels = min(number_of_nodes, math.log(number_of_nodes) / math.log(degree))
+    return max(1, math.ceil(regex_states * levels))
+
+
+def query_stats(
+    regex: str,
+    graph: nx.MultiDiGraph,
+    start_nodes: set = None,
+    regex_mode: str = "auto",
+) -> QueryStats:
+    compiled = compile_regex(regex, regex_mode)
+    regex_edges = np.bincount(
+        compiled.transitions[:, 1], minlength=len(compiled.symbols)
+    )
+    # Distinct edges per label, read from the cached graph matrices that the
+    # chosen engine then reuses
+    label_edges = {
+        label: matrix.nnz
+        for label, matrix in graph_matrices(graph).edge_matrices.items()
+    }
+
+    number_of_nodes = graph.number_of_nodes()
+    relevant_edges = sum(label_edges.get(symbol, 0) for symbol in compiled.symbols)
+    product_edges = sum(
+        int(count) * label_edges.get(symbol, 0)
+        for symbol, count in zip(compiled.symbols, regex_edges)
+    )
+
+    return QueryStats(
+        compiled.number_of_states,
+        len(compiled.symbols),
+        number_of_nodes,
+        sum(label_edges.values()),
+        label_edges,
+        relevant_edges,
+        product_edges,
+        len(start_nodes) if start_nodes else number_of_nodes,
+        estimate_depth(number_of_nodes, relevant_edges, compiled.number_of_states),
+    )
+
+
+# Few starts: one BFS over the product built with kron, one product per
+# level. Many starts: the full closure of the product
+def tensor_cost(stats: QueryStats) -> float:
+    product_states = stats.regex_states * stats.number_of_nodes
+    build = PRODUCT_EDGE_COST * stats.product_edges
+
+    full_closure_share = connected_vertices.FULL_CLOSURE_START_SHARE
+    if stats.number_of_starts > full_closure_share * stats.number_of_nodes:
+        return build + CLOSURE_COST * product_states * stats.product_edges
+
+    return (
+        build
+        + SEARCH_EDGE_COST * stats.number_of_starts * stats.product_edges
+        + stats.depth
+        * (
+            PRODUCT_CALL_COST
+            + VISITED_ENTRY_COST * stats.number_of_starts * product_states
+        )
+    )
+
+
+# No product is built, but every level takes two products per label
+def ms_bfs_cost(stats: QueryStats) -> float:
+    product_states = stats.regex_states * stats.number_of_nodes
+    return SEARCH_EDGE_COST * stats.number_of_starts * stats.product_edges + (
+        stats.depth
+        * (
+            2 * stats.regex_labels * PRODUCT_CALL_COST
+            + VISITED_ENTRY_COST * stats.number_of_starts * product_states
+        )
+    )
+
+
+# An engine is called as run(regex, graph, start_nodes, final_nodes,
+# **options) with the options its signature takes. Engines without a cost
+# model are used only when asked for by name
+RPQEngine = namedtuple("RPQEngine", ["run", "cost"])
+
+RPQ_ENGINES: dict[str, RPQEngine] = {}
+
+
+def register_engine(
+    name: str,
+    run: Callable[..., set[tuple]],
+    cost: Callable[[QueryStats], float] = None,
+):
+    RPQ_ENGINES[name] = RPQEngine(run, cost)
+
+
+register_engine("tensor", tensor_based_rpq, tensor_cost)
+register_engine("ms_bfs", ms_bfs_based_rpq, ms_bfs_cost)
+# Starts a process pool, so never picked by the cost models
+register_engine("parallel_ms_bfs", parallel_ms_bfs_based_rpq)
+
+
+# Keyword options of an engine past the four query arguments, None if it
+# takes any keyword
+def engine_options(engine: RPQEngine) -> set[str] | None:
+    parameters = list(inspect.signature(engine.run).parameters.values())
+    if any(p.kind is inspect.Parameter.VAR_KEYWORD for p in parameters):
+        return None
+    return {
+        p.name
+        for p in parameters[4:]
+        if p.kind
+        in (
+            inspect.Parameter.POSITIONAL_OR_KEYWORD,
+            inspect.Parameter.KEYWORD_ONLY,
+        )
+    }
+
+
+def _unknown_options(options: dict, engines: list[RPQEngine]) -> list[str]:
+    known = set()
+    for engine in engines:
+        accepted = engine_options(engine)
+        if accepted is None:
+            return []
+        known |= accepted
+    return sorted(set(options) - known)
+
+
+# The cheapest engine by the cost models with all estimates
+def choose_engine(stats: QueryStats) -> tuple[str, dict[str, float]]:
+    costs = {
+        name: engine.cost(stats)
+        for name, engine in RPQ_ENGINES.items()
+        if engine.cost is not None
+    }
+    return min(costs, key=costs.get), costs
+
+
+# Regular path query with the engine picked by name or, with "auto", by
+# the cost estimates. Other options go to the engine: a named engine must
+# take all of them, with "auto" every option must be taken by one of the
+# engines with a cost model and the chosen engine gets the ones it takes
+def rpq(
+    regex: str,
+    graph: nx.MultiDiGraph,
+    start_nodes: set = None,
+    final_nodes: set = None,
+    engine: str = "auto",
+    **options,
+) -> set[tuple]:
+    if engine == "auto":
+        candidates = [e for e in RPQ_ENGINES.values() if e.cost is not None]
+    elif engine in RPQ_ENGINES:
+        candidates = [RPQ_ENGINES[engine]]
+    else:
+        raise ValueError(
+            f"Unknown RPQ engine {engine!r}, "
+            f"expected auto or one of {', '.join(RPQ_ENGINES)}"
+        )
+    unknown = _unknown_options(options, candidates)
+    if unknown:
+        raise ValueError(
+            f"Unknown options {', '.join(unknown)} for RPQ engine {engine!r}"
+        )
+
+    if engine == "auto":
+        stats = query_stats(
+            regex, graph, start_nodes, options.get("regex_mode", "auto")
+        )
+        engine, costs = choose_engine(stats)
+        logger.info(
+            "RPQ engine %s chosen for %d regex states, %d nodes, %d edges "
+            "(%d with regex labels), %d starts, about %d levels; "
+            "estimated costs: %s",
+            engine,
+            stats.regex_states,
+            stats.number_of_nodes,
+            stats.number_of_edges,
+            stats.relevant_edges,
+            stats.number_of_starts,
+            stats.depth,
+            ", ".join(f"{name} {cost:.3g} s" for name, cost in costs.items()),
+        )
+
+    run = RPQ_ENGINES[engine].run
+    accepted = engine_options(RPQ_ENGINES[engine])
+    if accepted is not None:
+        options = {name: value for name, value in options.items() if name in accepted}
+    return run(regex, graph, start_nodes, final_nodes, **options)
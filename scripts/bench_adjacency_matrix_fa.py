@@ -0,0 +1,63 @@
+import sys
+import time
+
+import cfpq_data
+
+import shared
+
+
+LABELS = ["a", "b", "c", "d"]
+EDGE_COUNTS = [1_000, 10_000, 100_000]
+REPEATS = 3
+
+
+# setup runs before every repeat and is not timed
+def best_time(build, setup=lambda: None) -> float:
+    best = float("inf")
+    for _ in range(REPEATS):
+        setup()
+        start = time.perf_counter()
+        build()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+# Building from a ready NFA, and from the graph through graph_to_nfa
+# versus the direct edge-list ingestion. The graph cache is cleared before
+# every direct build, so repeats time the build and not cache hits
+def bench_build(number_of_edges: int) -> tuple[int, float, float, float]:
+    from project.regex.adjacency_matrix_fa import AdjacencyMatrixFA
+    from project.regex.create_finite_automaton import (
+        graph_cache,
+        graph_to_matrix_fa,
+        graph_to_nfa,
+    )
+
+    # A scale-free graph has about twice as many edges as nodes
+    graph = cfpq_data.labeled_scale_free_graph(number_of_edges // 2, labels=LABELS)
+    nfa = graph_to_nfa(graph, set(), set())
+
+    return (
+        graph.number_of_edges(),
+        best_time(lambda: AdjacencyMatrixFA(nfa)),
+        best_time(lambda: AdjacencyMatrixFA(graph_to_nfa(graph, set(), set()))),
+        best_time(lambda: graph_to_matrix_fa(graph), graph_cache.cache_clear),
+    )
+
+
+def main():
+    sys.path.insert(0, str(shared.ROOT))
+    print(
+        f"{'edges':>10} {'build, s':>10} {'us/edge':>10}"
+        f" {'via nfa, s':>12} {'direct, s':>10}"
+    )
+    for number_of_edges in EDGE_COUNTS:
+        edges, seconds, via_nfa, direct = bench_build(number_of_edges)
+        print(
+            f"{edges:>10} {seconds:>10.3f} {seconds / edges * 1e6:>10.2f}"
+            f" {via_nfa:>12.3f} {direct:>10.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
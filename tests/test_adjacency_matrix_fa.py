@@ -0,0 +1,283 @@
+import numpy as np
+import pytest
+from pyformlang.finite_automaton import NondeterministicFiniteAutomaton, State, Symbol
+from scipy.sparse import csr_matrix
+
+from project.regex.adjacency_matrix_fa import AdjacencyMatrixFA, intersect_automata
+from project.regex.closure import CLOSURE_STRATEGIES, difference, reachable_from
+from project.regex.create_finite_automaton import regex_to_dfa
+
+
+class TestAdjacencyMatrixFA:
+    # Checking word acceptance on a minimal DFA
+    def test_accepts(self):
+        fa = AdjacencyMatrixFA(regex_to_dfa("a b* c"))
+
+        assert fa.accepts("ac")
+        assert fa.accepts("abbbc")
+        assert not fa.accepts("ab")
+        assert not fa.accepts("abca")
+        assert not fa.accepts("d")
+        assert not fa.accepts("")
+
+    # Checking that batch acceptance agrees with accepting words one by one
+    def test_accepts_many(self):
+        fa = AdjacencyMatrixFA(regex_to_dfa("(a b)* | c"))
+        words = ["", "ab", "abab", "aba", "c", "cc", "ab", "d", "abc"]
+
+        assert fa.accepts_many(words) == [fa.accepts(word) for word in words]
+        assert fa.accepts_many(words) == [
+            True,
+            True,
+            True,
+            False,
+            True,
+            False,
+            True,
+            False,
+            False,
+        ]
+
+    # Checking that every closure strategy gives the same reflexive closure
+    @pytest.mark.parametrize("strategy", ["auto", *CLOSURE_STRATEGIES])
+    def test_transitive_closure(self, strategy: str):
+        fa = AdjacencyMatrixFA(regex_to_dfa("a (b c)* d | e*"))
+        expected = np.eye(fa.number_of_states, dtype=bool)
+        for _ in range(fa.number_of_states):
+            expected |= expected @ fa.adjacency_matrix().toarray()
+
+        closure = fa.transitive_сlosure(strategy)
+
+        assert (closure.toarray() == expected).all()
+
+    # Checking that an unknown closure strategy is rejected
+    def test_unknown_closure_strategy(self):
+        fa = AdjacencyMatrixFA(regex_to_dfa("a"))
+
+        with pytest.raises(ValueError):
+            fa.transitive_сlosure("magic")
+
+    # Checking that a multi-source BFS gives the closure rows of every set
+    # of start states
+    def test_reachable_from(self):
+        fa = AdjacencyMatrixFA(regex_to_dfa("a (b c)* d | e*"))
+        sources = np.zeros((3, fa.number_of_states), dtype=bool)
+        sources[0, 0] = True
+        sources[1, 1:3] = True
+
+        reached = reachable_from(fa.adjacency_matrix(), csr_matrix(sources))
+        expected = sources @ fa.transitive_сlosure().toarray()
+
+        assert (reached.toarray() == expected).all()
+
+    # Checking that the difference keeps no explicit zeros
+    def test_difference(self):
+        minuend = csr_matrix(np.array([[1, 1, 0], [0, 1, 1]], dtype=bool))
+        subtrahend = csr_matrix(np.array([[1, 0, 1], [0, 1, 1]], dtype=bool))
+
+        result = difference(minuend, subtrahend)
+
+        assert result.nnz == 1
+        assert (result.toarray() == [[0, 1, 0], [0, 0, 0]]).all()
+
+    # Checking that transposed matrices follow edits of the automaton
+    def test_transposed_matrices(self):
+        fa = AdjacencyMatrixFA(regex_to_dfa("a b"))
+        transposed = fa.transposed_matrices()
+        assert all(
+            (t.toarray() == m.toarray().T).all()
+            for t, m in zip(transposed, fa.matrices)
+        )
+        assert fa.transposed_matrices()[0] is transposed[0]
+
+        fa.add_transition(0, "c", 1)
+        fa.add_transition(1, "a", 0)
+
+        assert all(
+            (t.toarray() == m.toarray().T).all()
+            for t, m in zip(fa.transposed_matrices(), fa.matrices)
+        )
+
+    # Checking emptiness when searching forward from a single start state
+    # and backward from a single final state
+    def test_is_empty(self):
+        nfa = NondeterministicFiniteAutomaton()
+        nfa.add_transitions([(0, "a", 1), (1, "b", 2), (3, "c", 0)])
+        nfa.add_start_state(0)
+        nfa.add_final_state(2)
+        nfa.add_final_state(3)
+        assert not AdjacencyMatrixFA(nfa).is_empty()
+
+        nfa = NondeterministicFiniteAutomaton()
+        nfa.add_transitions([(0, "a", 1), (1, "b", 2), (3, "c", 0)])
+        for state in (0, 1, 2):
+            nfa.add_start_state(state)
+        nfa.add_final_state(3)
+        assert AdjacencyMatrixFA(nfa).is_empty()
+
+        assert AdjacencyMatrixFA(regex_to_dfa("a b")).is_empty() is False
+        assert intersect_automata(
+            AdjacencyMatrixFA(regex_to_dfa("a b")),
+            AdjacencyMatrixFA(regex_to_dfa("a c")),
+        ).is_empty()
+
+    # Checking that product ids, start and final states of the intersection
+    # follow the i * n2 + j numbering
+    def test_intersect_automata(self):
+        fa1 = AdjacencyMatrixFA(regex_to_dfa("a* b"))
+        fa2 = AdjacencyMatrixFA(regex_to_dfa("a b*"))
+        product = intersect_automata(fa1, fa2)
+
+        assert product.number_of_states == fa1.number_of_states * fa2.number_of_states
+        assert set(product.decomposition) == {"a", "b"}
+        assert product.start_mask().sum() == len(product.start_ids) == 1
+        for id in product.final_ids:
+            id1, id2 = product.split_id(id)
+            assert id1 in fa1.final_ids and id2 in fa2.final_ids
+            assert product.product_id(id1, id2) == id
+        assert product.accepts("ab")
+        assert not product.accepts("aab")
+
+        states = product.states
+        assert product.start_states == {State(states[i]) for i in product.start_ids}
+        assert product.final_states == {State(states[i]) for i in product.final_ids}
+        assert product.id_state == {i: State(value) for i, value in enumerate(states)}
+
+    # Checking that states are dense ids and pyformlang states are only
+    # rebuilt at the boundary
+    def test_state_tables(self):
+        nfa = NondeterministicFiniteAutomaton()
+        nfa.add_transitions([(0, "a", 1), (1, "b", 2)])
+        nfa.add_start_state(0)
+        nfa.add_final_state(2)
+        fa = AdjacencyMatrixFA(nfa)
+
+        assert not hasattr(fa, "__dict__")
+        assert sorted(fa.states) == [0, 1, 2]
+        assert fa.states[fa.state_id[State(2)]] == 2
+        assert fa.start_states == {State(0)}
+        assert fa.final_states == {State(2)}
+        assert set(fa.symbols) == {Symbol("a"), Symbol("b")}
+        assert fa.symbols[fa.symbol_id["b"]] == Symbol("b")
+        assert fa.start_mask().sum() == fa.final_mask().sum() == 1
+
+    # Checking that the state tables built from the integer core cannot be
+    # edited, so edits raise instead of being lost
+    def test_state_tables_read_only(self):
+        fa = AdjacencyMatrixFA(regex_to_dfa("a b"))
+        product = intersect_automata(fa, fa)
+
+        for automaton in (fa, product):
+            with pytest.raises(AttributeError):
+                automaton.start_states.add(State(0))
+            with pytest.raises(AttributeError):
+                automaton.final_states.discard(next(iter(automaton.final_states)))
+            with pytest.raises(TypeError):
+                automaton.id_state[0] = State(42)
+        fa.start_ids = np.array([fa.state_id[state] for state in fa.final_states])
+        assert fa.start_states == fa.final_states
+
+    # Checking that a saved automaton is loaded back with memory-mapped
+    # index arrays and the same state tables and language
+    @pytest.mark.parametrize("mmap", [True, False])
+    def test_save_load(self, tmp_path, mmap: bool):
+        fa = intersect_automata(
+            AdjacencyMatrixFA(regex_to_dfa("a b* c")),
+            AdjacencyMatrixFA(regex_to_dfa("a (b | c)*")),
+        )
+        path = tmp_path / "product.amfa"
+        fa.save(path)
+
+        loaded = AdjacencyMatrixFA.load(path, mmap)
+
+        assert loaded.states == fa.states
+        assert loaded.symbols == fa.symbols
+        assert (loaded.start_ids == fa.start_ids).all()
+        assert (loaded.final_ids == fa.final_ids).all()
+        for symbol in fa.symbols:
+            matrix = loaded.decomposition[symbol]
+            assert (matrix != fa.decomposition[symbol]).nnz == 0
+            if mmap and matrix.nnz > 0:
+                assert not matrix.indices.flags.writeable
+        assert loaded.accepts_many(["abc", "ab", "ac"]) == [True, False, True]
+
+    # Checking that files of another format are rejected
+    def test_load_wrong_format(self, tmp_path):
+        path = tmp_path / "graph.txt"
+        path.write_bytes(b"not an automaton at all")
+
+        with pytest.raises(ValueError):
+            AdjacencyMatrixFA.load(path)
+
+    # Checking that buffered edits and the maintained closure agree with
+    # an automaton built from scratch
+    @pytest.mark.parametrize("backend", ["sparse", "bitpacked"])
+    def test_incremental_transitions(self, backend: str):
+        nfa = NondeterministicFiniteAutomaton()
+        nfa.add_transitions([(0, "a", 1), (1, "b", 2), (2, "a", 0), (2, "b", 3)])
+        nfa.add_start_state(0)
+        nfa.add_final_state(3)
+        fa = AdjacencyMatrixFA(nfa)
+        fa.use_backend(backend)
+        fa.maintain_closure()
+
+        assert fa.add_transition(3, "c", 4)
+        assert not fa.add_transition(3, "c", 4)
+        assert fa.remove_transition(2, "a", 0)
+        assert not fa.remove_transition(2, "a", 0)
+        assert fa.add_transition(1, "a", 2)
+        assert fa.remove_transition(1, "b", 2)
+        assert fa.add_transition(4, "b", 1)
+
+        expected = NondeterministicFiniteAutomaton()
+        expected.add_transitions(
+            [(0, "a", 1), (1, "a", 2), (2, "b", 3), (3, "c", 4), (4, "b", 1)]
+        )
+        expected_fa = AdjacencyMatrixFA(expected)
+        ids = [expected_fa.state_id[value] for value in fa.states]
+
+        assert fa.number_of_states == 5
+        assert (
+            fa.transitive_сlosure().toarray()
+            == expected_fa.transitive_сlosure().toarray()[np.ix_(ids, ids)]
+        ).all()
+        assert fa.accepts("aabcbab")
+        assert not fa.accepts("ab")
+        assert set(fa.decomposition) == {"a", "b", "c"}
+
+    # Checking that labels are dense ids into the matrix list and that
+    # degree statistics and shared labels are computed by label id
+    def test_label_matrices(self):
+        nfa = NondeterministicFiniteAutomaton()
+        nfa.add_transitions([(0, "a", 1), (0, "a", 2), (1, "b", 2), (2, "b", 2)])
+        fa = AdjacencyMatrixFA(nfa)
+        a, b = fa.symbol_id["a"], fa.symbol_id["b"]
+        ids = [fa.state_id[state] for state in (0, 1, 2)]
+
+        assert fa.matrix("a") is fa.matrices[a]
+        assert fa.decomposition["b"] is fa.matrices[b]
+        assert fa.matrix("c") is None
+        out_degrees, in_degrees = fa.degree_statistics()
+        assert out_degrees[a, ids].tolist() == [2, 0, 0]
+        assert in_degrees[b, ids].tolist() == [0, 0, 2]
+        assert fa.adjacency_matrix().nnz == out_degrees.sum() == 4
+
+        other = AdjacencyMatrixFA(regex_to_dfa("b c"))
+        assert fa.shared_labels(other) == [(b, other.symbol_id["b"])]
+
+    # Checking that writing to the decomposition view raises instead of
+    # being lost, and that set_symbol_matrix changes the automaton
+    def test_decomposition_read_only(self):
+        fa = AdjacencyMatrixFA(regex_to_dfa("a b"))
+        matrix = csr_matrix(
+            ([True], ([0], [0])), shape=(fa.number_of_states,) * 2, dtype=bool
+        )
+
+        with pytest.raises(TypeError):
+            fa.decomposition[Symbol("c")] = matrix
+        with pytest.raises(TypeError):
+            del fa.decomposition[Symbol("a")]
+        assert fa.matrix("c") is None
+
+        fa.set_symbol_matrix(Symbol("c"), matrix)
+        assert fa.decomposition[Symbol("c")] is matrix
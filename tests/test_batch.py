@@ -0,0 +1,45 @@
+import cfpq_data
+import pytest
+
+from project.regex.batch import batch_rpq
+from project.regex.reachability import ms_bfs_based_rpq
+
+
+REGEXES = [
+    "a* b",
+    "b a",
+    "(a | b)*",
+    "a b* a",
+    "c",
+    "a (b | c)*",
+    "b*",
+    "a a",
+    "(a b)*",
+]
+
+
+class TestBatchRPQ:
+    # Checking every answer of a batch against its own ms-BFS, with regexes
+    # over different alphabets and batches split by the state limit
+    @pytest.mark.parametrize("max_states", [1, 4, 64])
+    @pytest.mark.parametrize("start_nodes", [None, {0, 3}])
+    def test_batch_rpq(self, max_states: int, start_nodes: set[int]):
+        graph = cfpq_data.labeled_two_cycles_graph(4, 3, labels=("a", "b"))
+        graph.add_edge(2, 5, label="c")
+
+        answers = batch_rpq(
+            REGEXES, graph, start_nodes, {1, 2, 5}, max_states=max_states
+        )
+
+        assert answers == [
+            ms_bfs_based_rpq(regex, graph, start_nodes, {1, 2, 5}) for regex in REGEXES
+        ]
+
+    # Checking labels missing from the graph and an empty batch
+    def test_missing_labels(self):
+        graph = cfpq_data.labeled_two_cycles_graph(3, 2, labels=("a", "b"))
+
+        assert batch_rpq(["d", "d*", "a"], graph) == [
+            ms_bfs_based_rpq(regex, graph) for regex in ["d", "d*", "a"]
+        ]
+        assert batch_rpq([], graph) == []
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+from scipy.sparse import random as sparse_random
+
+from project.regex.adjacency_matrix_fa import AdjacencyMatrixFA, intersect_automata
+from project.regex import bit_matrix
+from project.regex.bit_matrix import BitMatrix, to_backend
+from project.regex.create_finite_automaton import regex_to_dfa
+
+
+def random_matrix(rows: int, cols: int, density: float, seed: int):
+    return sparse_random(
+        rows, cols, density=density, format="csr", dtype=bool, random_state=seed
+    )
+
+
+class TestBitMatrix:
+    # Checking packing round trips, including widths that are not
+    # a multiple of the word size
+    @pytest.mark.parametrize("cols", [1, 63, 64, 65, 130])
+    def test_round_trip(self, cols: int):
+        matrix = random_matrix(17, cols, 0.2, cols)
+        bits = BitMatrix.from_sparse(matrix)
+
+        assert (bits.toarray() == matrix.toarray()).all()
+        assert bits.nnz == matrix.nnz
+        assert (bits.T.toarray() == matrix.T.toarray()).all()
+        assert (bits.tocsr() != matrix).nnz == 0
+
+    # Checking conversions that unpack the rows in several blocks
+    def test_blocks(self, monkeypatch):
+        monkeypatch.setattr(bit_matrix, "UNPACK_BLOCK_BITS", 100)
+        matrix = random_matrix(50, 70, 0.1, 4)
+        bits = BitMatrix.from_sparse(matrix)
+        csr = bits.tocsr()
+
+        assert (csr != matrix).nnz == 0 and csr.has_sorted_indices
+        assert (bits.T.tocsr() != matrix.T).nnz == 0
+        assert BitMatrix((0, 5)).tocsr().shape == (0, 5)
+
+    # Checking boolean products against scipy
+    def test_products(self):
+        left = random_matrix(70, 90, 0.05, 1)
+        right = random_matrix(90, 40, 0.05, 2)
+        vector = np.random.default_rng(3).random(70) < 0.3
+        expected = (left.astype(int) @ right.astype(int)).toarray() > 0
+
+        assert ((BitMatrix.from_sparse(left) @ right).toarray() == expected).all()
+        assert (
+            vector @ BitMatrix.from_sparse(left)
+            == (vector @ left.toarray()).astype(bool)
+        ).all()
+        assert (
+            BitMatrix.from_sparse(right) @ vector[:40]
+            == (right.toarray() @ vector[:40]).astype(bool)
+        ).all()
+
+    # Checking that automata give the same answers on both backends
+    @pytest.mark.parametrize("backend", ["bitpacked", "auto"])
+    def test_automaton_backend(self, backend: str):
+        fa1 = AdjacencyMatrixFA(regex_to_dfa("a (b c)* d | e*"))
+        fa2 = AdjacencyMatrixFA(regex_to_dfa("(a | b | c | d)*"))
+        product = intersect_automata(fa1, fa2)
+        packed = intersect_automata(fa1, fa2, backend)
+        packed.use_backend(backend)
+
+        for word in ["", "ad", "abcd", "abcbcd", "eee", "abd"]:
+            assert packed.accepts(word) == product.accepts(word)
+        assert packed.is_empty() == product.is_empty()
+        assert (
+            packed.transitive_сlosure().toarray()
+            == product.transitive_сlosure().toarray()
+        ).all()
+
+    # Checking that an unknown backend is rejected
+    def test_unknown_backend(self):
+        with pytest.raises(ValueError):
+            to_backend(random_matrix(2, 2, 0.5, 0), "gpu")
@@ -0,0 +1,109 @@
+import cfpq_data
+import numpy as np
+import pytest
+
+from project.regex import connected_vertices
+from project.regex.connected_vertices import (
+    rpq_exists,
+    tensor_based_rpq,
+    tensor_based_rpq_arrays,
+)
+from project.regex.create_finite_automaton import graph_to_matrix_fa
+from project.regex.reachability import (
+    ms_bfs_based_rpq,
+    ms_bfs_based_rpq_arrays,
+    ms_bfs_based_rpq_chunks,
+)
+
+
+class TestTensorBasedRPQ:
+    # Checking that the BFS from the start nodes and the full closure of
+    # the product find the same pairs
+    @pytest.mark.parametrize("start_nodes", [{0}, {1, 5, 7}, set()])
+    def test_start_restricted(self, monkeypatch, start_nodes: set[int]):
+        graph = cfpq_data.labeled_two_cycles_graph(5, 4, labels=("a", "b"))
+        regex = "a* b | (a b)*"
+
+        restricted = tensor_based_rpq(regex, graph, start_nodes, {0, 3, 6})
+        monkeypatch.setattr(connected_vertices, "FULL_CLOSURE_START_SHARE", 0)
+        full = tensor_based_rpq(regex, graph, start_nodes, {0, 3, 6})
+
+        assert restricted == full
+        assert all(start in (start_nodes or graph.nodes) for start, _ in full)
+
+
+class TestRPQArrays:
+    # Checking that both engines give the answer as arrays of distinct node
+    # pairs equal to the set answer
+    @pytest.mark.parametrize(
+        "rpq, rpq_arrays",
+        [
+            (tensor_based_rpq, tensor_based_rpq_arrays),
+            (ms_bfs_based_rpq, ms_bfs_based_rpq_arrays),
+        ],
+    )
+    def test_arrays(self, rpq, rpq_arrays):
+        graph = cfpq_data.labeled_two_cycles_graph(5, 4, labels=("a", "b"))
+        regex = "(a | b)* b | a a"
+
+        starts, finals = rpq_arrays(regex, graph, {0, 2, 6}, set())
+
+        assert starts.dtype == finals.dtype == np.int64
+        pairs = list(zip(starts.tolist(), finals.tolist()))
+        assert len(pairs) == len(set(pairs))
+        assert set(pairs) == rpq(regex, graph, {0, 2, 6}, set())
+
+
+class TestMsBfsChunks:
+    # Checking that the chunks cover the whole answer and hold at most
+    # chunk_size start nodes each
+    @pytest.mark.parametrize("chunk_size", [1, 3, 100])
+    def test_chunks(self, chunk_size: int):
+        graph = cfpq_data.labeled_two_cycles_graph(5, 4, labels=("a", "b"))
+        regex = "a* b (a | b)"
+
+        chunks = list(ms_bfs_based_rpq_chunks(regex, graph, chunk_size=chunk_size))
+        pairs = {
+            pair
+            for starts, finals in chunks
+            for pair in zip(starts.tolist(), finals.tolist())
+        }
+
+        assert pairs == ms_bfs_based_rpq(regex, graph)
+        assert all(len(set(starts.tolist())) <= chunk_size for starts, _ in chunks)
+
+    # Checking that a tiny memory budget gives one start node per chunk
+    def test_memory_budget(self):
+        graph = cfpq_data.labeled_two_cycles_graph(5, 4, labels=("a", "b"))
+
+        chunks = list(ms_bfs_based_rpq_chunks("a*", graph, memory_budget=1))
+
+        assert len(chunks) == graph.number_of_nodes()
+        with pytest.raises(ValueError):
+            next(ms_bfs_based_rpq_chunks("a*", graph, chunk_size=0))
+
+
+class TestRPQExists:
+    # Checking every pair of nodes against the full answer, with the graph
+    # given both as a networkx graph and as a prebuilt automaton, for the
+    # minimized DFA and the Glushkov automaton of the regex
+    @pytest.mark.parametrize("regex_mode", ["dfa", "glushkov"])
+    @pytest.mark.parametrize("regex", ["a* b", "(a b)* | b a", "$", "a a a a a a"])
+    def test_rpq_exists(self, regex: str, regex_mode: str):
+        graph = cfpq_data.labeled_two_cycles_graph(3, 2, labels=("a", "b"))
+        graph_fa = graph_to_matrix_fa(graph)
+        answer = tensor_based_rpq(regex, graph)
+
+        for u in graph.nodes:
+            for v in graph.nodes:
+                assert rpq_exists(regex, graph_fa, u, v, regex_mode) == (
+                    (u, v) in answer
+                )
+        assert rpq_exists(regex, graph, 0, 0) == ((0, 0) in answer)
+
+    # Checking that nodes outside the graph are never connected
+    def test_unknown_nodes(self):
+        graph = cfpq_data.labeled_two_cycles_graph(3, 2, labels=("a", "b"))
+
+        assert not rpq_exists("a*", graph, 0, 42)
+        assert not rpq_exists("a*", graph, 42, 42)
@@ -1,7 +1,27 @@
+import networkx as nx
+import numpy as np
 import pytest
 
+from project.regex.adjacency_matrix_fa import AdjacencyMatrixFA
 from project.regex.graph import load_graph, load_graph_from_dot
-from project.regex.create_finite_automaton import regex_to_dfa, graph_to_nfa
+from project.regex.create_finite_automaton import (
+    edges_to_matrix_fa,
+    graph_to_matrix_fa,
+    graph_to_nfa,
+    regex_to_dfa,
+)
+
+
+def automaton_edges(fa: AdjacencyMatrixFA) -> tuple[dict, set, set]:
+    edges = {
+        str(symbol): {(fa.states[i], fa.states[j]) for i, j in zip(*matrix.nonzero())}
+        for symbol, matrix in fa.decomposition.items()
+    }
+    return (
+        edges,
+        {fa.states[i] for i in fa.start_ids},
+        {fa.states[i] for i in fa.final_ids},
+    )
 
 
 class TestFA:
@@ -56,3 +76,44 @@ class TestFA:
             assert len(set(int(state.value) for state in nfa.states)) == len(
                 graph.nodes
             )
+
+    # Checking that the direct ingestion builds the same automaton as
+    # graph_to_nfa, including epsilon removal and is_start / is_final marks
+    @pytest.mark.parametrize(
+        "start_states, final_states", [((), ()), ({0}, {3}), ({1, 4}, ())]
+    )
+    def test_graph_to_matrix_fa(self, start_states: set, final_states: set):
+        graph = nx.MultiDiGraph()
+        graph.add_edges_from(
+            [
+                (0, 1, {"label": "a"}),
+                (1, 2, {"label": "epsilon"}),
+                (2, 3, {"label": "b"}),
+                (2, 3, {"label": "a"}),
+                (3, 0, {"label": "epsilon"}),
+                (4, 4, {"label": "b"}),
+            ]
+        )
+        graph.nodes[2]["is_final"] = True
+        graph.nodes[3]["is_start"] = True
+
+        assert automaton_edges(
+            graph_to_matrix_fa(graph, start_states, final_states)
+        ) == automaton_edges(
+            AdjacencyMatrixFA(graph_to_nfa(graph, start_states, final_states))
+        )
+
+    # Checking the ingestion of plain edge arrays
+    def test_edges_to_matrix_fa(self):
+        fa = edges_to_matrix_fa(
+            np.array([10, 20, 20]),
+            np.array(["a", "b", "a"]),
+            np.array([20, 30, 10]),
+            {10},
+            nodes=np.array([40]),
+        )
+        edges, start, final = automaton_edges(fa)
+
+        assert edges == {"a": {(10, 20), (20, 10)}, "b": {(20, 30)}}
+        assert start == {10}
+        assert final == {10, 20, 30, 40}
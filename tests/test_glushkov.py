@@ -0,0 +1,90 @@
+import random
+
+import pytest
+from pyformlang.finite_automaton import NondeterministicFiniteAutomaton
+from pyformlang.regular_expression import Regex
+from pyformlang.regular_expression.regex_objects import MisformedRegexError
+
+from project.regex.create_finite_automaton import regex_to_dfa
+from project.regex.glushkov import compile_regex, parse_regex, regex_to_matrix_fa
+
+
+def to_nfa(regex: str, mode: str) -> NondeterministicFiniteAutomaton:
+    compiled = compile_regex(regex, mode)
+    nfa = NondeterministicFiniteAutomaton()
+    for from_st, label, to_st in compiled.transitions.tolist():
+        nfa.add_transition(from_st, compiled.symbols[label], to_st)
+    if compiled.start >= 0:
+        nfa.add_start_state(compiled.start)
+    for final in compiled.finals.tolist():
+        nfa.add_final_state(final)
+    return nfa
+
+
+REGEXES = [
+    "a*b|c|d",
+    "(a|b|c)* d (a|b)* e",
+    "a b . c* | $",
+    "(ab + cd)* ab",
+    "epsilon | x (y z)*",
+    "\\* a",
+    "",
+]
+
+# Regexes that pyformlang reads with a missing operand or rejects, and
+# random token strings over its operators
+EDGE_REGEXES = ["a|", "(a|)", "b.", "b+", "(a|b).", "a*|", "((a|))*", "$+a"]
+MISFORMED_REGEXES = ["|a", "a||b", "a.|b", "a(|)b", "*", "()", "(a", "a)"]
+RANDOM_REGEXES = [
+    "".join(random.Random(seed).choices("ab|+.*()$ ", k=1 + seed % 8))
+    for seed in range(300)
+]
+
+
+class TestGlushkov:
+    # Checking that precedence and n-ary nodes follow the pyformlang syntax
+    def test_parse_regex(self):
+        assert parse_regex("a b|c*") == (
+            "union",
+            [("concat", [("symbol", "a"), ("symbol", "b")]), ("star", ("symbol", "c"))],
+        )
+        assert parse_regex("ab.$") == ("concat", [("symbol", "ab"), ("epsilon",)])
+
+    # Checking that every mode accepts the same language as pyformlang
+    @pytest.mark.parametrize("mode", ["glushkov", "dfa", "auto"])
+    @pytest.mark.parametrize("regex", REGEXES)
+    def test_same_language(self, regex: str, mode: str):
+        assert to_nfa(regex, mode).is_equivalent_to(regex_to_dfa(regex))
+
+    # Checking the native parser against the pyformlang pipeline: the same
+    # language wherever pyformlang reads the regex, an error otherwise
+    @pytest.mark.parametrize("mode", ["glushkov", "auto"])
+    def test_pyformlang_equivalence(self, mode: str):
+        for regex in EDGE_REGEXES + MISFORMED_REGEXES + RANDOM_REGEXES:
+            try:
+                expected = Regex(regex).to_epsilon_nfa()
+            except (MisformedRegexError, IndexError):
+                assert regex not in EDGE_REGEXES
+                with pytest.raises(MisformedRegexError):
+                    compile_regex(regex, mode)
+                continue
+            assert regex not in MISFORMED_REGEXES
+            assert to_nfa(regex, mode).is_equivalent_to(expected), regex
+
+    # Checking automaton sizes: one state per symbol occurrence in the
+    # Glushkov mode, the minimal DFA in the dfa mode
+    def test_sizes(self):
+        regex = "(a|b|c)* d (a|b)* e"
+
+        assert compile_regex(regex, "glushkov").number_of_states == 8
+        assert compile_regex(regex, "dfa").number_of_states == len(
+            regex_to_dfa(regex).states
+        )
+        fa = regex_to_matrix_fa(regex, "auto")
+        assert fa.accepts("abcdabe")
+        assert not fa.accepts("abcde d")
+
+    # Checking that unknown modes are rejected
+    def test_unknown_mode(self):
+        with pytest.raises(ValueError):
+            compile_regex("a", "thompson")
@@ -0,0 +1,133 @@
+import cfpq_data
+import networkx as nx
+import pytest
+
+from project.cfg.matrix import matrix_based_cfpq
+from project.regex.create_finite_automaton import (
+    _graph_matrices,
+    graph_cache,
+    graph_to_matrix_fa,
+)
+from project.regex import graph_cache as graph_cache_module
+from project.regex.graph_cache import (
+    FingerprintedGraph,
+    GraphCache,
+    GraphEdges,
+    graph_fingerprint,
+)
+from project.regex.connected_vertices import tensor_based_rpq
+from project.regex.reachability import ms_bfs_based_rpq
+from pyformlang.cfg import CFG
+
+
+def build(edges: GraphEdges):
+    return _graph_matrices(*edges)
+
+
+class TestGraphFingerprint:
+    # Checking that the fingerprint depends on the nodes, edges and labels
+    # rather than on the graph object, also for nodes with equal Python
+    # hashes
+    def test_content(self):
+        graph = cfpq_data.labeled_two_cycles_graph(3, 2, labels=("a", "b"))
+        same = nx.MultiDiGraph(graph)
+
+        assert graph_fingerprint(graph) == graph_fingerprint(same)
+        same.add_edge(0, 1, label="c")
+        assert graph_fingerprint(graph) != graph_fingerprint(same)
+        assert graph_fingerprint(
+            nx.MultiDiGraph([(0, -1, {"label": "a"})])
+        ) != graph_fingerprint(nx.MultiDiGraph([(0, -2, {"label": "a"})]))
+        assert graph_fingerprint(
+            nx.MultiDiGraph([(1, 2**61 - 1, {"label": "a"})])
+        ) != graph_fingerprint(nx.MultiDiGraph([(1, 0, {"label": "a"})]))
+
+    # Checking that every edit of a FingerprintedGraph is seen by the cache
+    # the same way as by a full pass over a copy of it
+    def test_versions(self):
+        graph = FingerprintedGraph(
+            cfpq_data.labeled_two_cycles_graph(3, 2, labels=("a", "b"))
+        )
+        edits = [
+            lambda: graph.add_edge(0, 1, label="c"),
+            lambda: graph.add_edges_from([(1, 7, {"label": "a"}), (7, 7, "k")]),
+            lambda: graph.add_edge(7, 7, "k", label="b"),
+            lambda: graph.add_node(2, is_start=True),
+            lambda: graph.remove_edge(0, 1),
+            lambda: graph.remove_node(1),
+            lambda: graph.clear_edges(),
+        ]
+        cache = GraphCache()
+
+        for edit in edits:
+            edit()
+            assert cache.get(graph, build) is cache.get(nx.MultiDiGraph(graph), build)
+        assert cache.cache_info()[:2] == (len(edits), len(edits))
+
+
+class TestGraphCache:
+    # Checking that equal graphs share an entry and that the least recently
+    # used entries are evicted to fit the memory budget
+    def test_lru(self):
+        graphs = [
+            cfpq_data.labeled_two_cycles_graph(n, n, labels=("a", "b"))
+            for n in (10, 20, 30)
+        ]
+        cache = GraphCache()
+        for graph in graphs:
+            cache.get(graph, build)
+        cache.get(nx.MultiDiGraph(graphs[0]), build)
+        assert cache.cache_info()[:2] == (1, 3)
+
+        cache.configure(memory_budget=cache.nbytes() - 1)
+        assert cache.cache_info().currsize == 2
+        cache.get(graphs[1], build)
+        assert cache.cache_info().misses == 4
+
+    # Checking that queries through the shared cache see edits of the graph
+    # and that cached automata are not changed by the engines
+    @pytest.mark.parametrize("graph_type", [nx.MultiDiGraph, FingerprintedGraph])
+    def test_queries(self, graph_type):
+        graph = graph_type(cfpq_data.labeled_two_cycles_graph(3, 2, labels=("a", "b")))
+        graph_cache.cache_clear()
+
+        before = ms_bfs_based_rpq("a b", graph, {0})
+        assert ms_bfs_based_rpq("a b", graph, {0}) == before
+        graph.add_edge(0, 10, label="a")
+        graph.add_edge(10, 11, label="b")
+        assert ms_bfs_based_rpq("a b", graph, {0}) == before | {(0, 11)}
+        assert graph_cache.cache_info()[:2] == (1, 2)
+
+        graph_to_matrix_fa(graph).add_transition(0, "c", 1)
+        assert graph_to_matrix_fa(graph).matrix("c") is None
+
+    # Checking the matrix CFPQ on label matrices of the cache
+    def test_matrix_cfpq(self):
+        graph = cfpq_data.labeled_two_cycles_graph(3, 2, labels=("a", "b"))
+        cfg = CFG.from_text("S -> a S b | $")
+        graph_cache.cache_clear()
+
+        answer = matrix_based_cfpq(cfg, graph)
+        assert matrix_based_cfpq(cfg, graph) == answer
+        assert (0, 0) in answer and (3, 5) in answer
+        assert graph_cache.cache_info().hits == 1
+
+    # Checking that a hit is returned only for the edge list the entry was
+    # built from, even when two graphs get the same key
+    def test_collision(self, monkeypatch):
+        monkeypatch.setattr(graph_cache_module, "edges_fingerprint", lambda _: b"key")
+        cache = GraphCache()
+        first = nx.MultiDiGraph([(0, -1, {"label": "a"})])
+        second = nx.MultiDiGraph([(0, -2, {"label": "a"})])
+
+        assert cache.get(first, build).automaton.states == [0, -1]
+        assert cache.get(second, build).automaton.states == [0, -2]
+        assert cache.cache_info()[:2] == (0, 2)
+
+    # Checking that graphs whose nodes hash alike get their own answers
+    def test_hash_collision_queries(self):
+        graph_cache.cache_clear()
+        for target in (-1, -2, 2**61 - 1, 0):
+            graph = nx.MultiDiGraph([(1, target, {"label": "a"})])
+            assert tensor_based_rpq("a", graph, {1}, set()) == {(1, target)}
+            assert ms_bfs_based_rpq("a", graph, {1}, set()) == {(1, target)}
@@ -0,0 +1,61 @@
+import cfpq_data
+import networkx as nx
+import numpy as np
+import pytest
+
+from project.regex import graph as graph_module
+from project.regex.graph import graph_info, graph_stats, load_graph
+from project.regex.graph_stats import csv_stats, store_stats
+from project.regex.graph_store import convert_csv, open_graph_store
+
+
+EDGES = [(0, 1, "a"), (1, 2, "b"), (2, 0, "a"), (1, 2, "b"), (5, 5, "c"), (2, 2, "a")]
+
+
+def degree_histogram(degrees) -> list[int]:
+    return np.bincount([degree for _, degree in degrees]).tolist()
+
+
+@pytest.fixture
+def csv(tmp_path) -> str:
+    path = tmp_path / "graph.csv"
+    path.write_text("".join(f"{u} {v} {label}\n" for u, v, label in EDGES))
+    return str(path)
+
+
+class TestGraphStats:
+    # Checking both passes, in chunks of every size, against networkx
+    @pytest.mark.parametrize("chunk_size", [1, 4, 100])
+    def test_stats(self, tmp_path, csv: str, chunk_size: int):
+        graph = cfpq_data.graph_from_csv(csv)
+        convert_csv(csv, tmp_path / "graph.graph")
+        stored = open_graph_store(tmp_path / "graph.graph")
+
+        for stats in [csv_stats(csv, chunk_size), store_stats(stored, chunk_size)]:
+            assert stats.number_of_nodes == graph.number_of_nodes()
+            assert stats.number_of_edges == graph.number_of_edges()
+            assert stats.labels == cfpq_data.get_sorted_labels(graph)
+            assert stats.label_counts == {"a": 3, "b": 2, "c": 1}
+            assert stats.out_degree_histogram == degree_histogram(graph.out_degree)
+            assert stats.in_degree_histogram == degree_histogram(graph.in_degree)
+            assert stats.self_loops == nx.number_of_selfloops(graph)
+        assert stored._networkx is None
+
+    # Checking that statistics are cached next to the store and that
+    # graph_info keeps its triple
+    def test_graph_stats(self, tmp_path, csv: str, monkeypatch):
+        downloads = []
+
+        def download(name: str) -> str:
+            downloads.append(name)
+            return csv
+
+        monkeypatch.setattr(graph_module.cfpq, "download", download)
+        stats = graph_stats("wc", tmp_path)
+        assert graph_stats("wc", tmp_path) == stats
+        assert graph_info("wc", tmp_path) == (4, 6, ["a", "b", "c"])
+        assert downloads == ["wc"]
+
+        load_graph("other", tmp_path)
+        assert graph_stats("other", tmp_path) == stats
+        assert downloads == ["wc", "other"]
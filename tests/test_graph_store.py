@@ -0,0 +1,91 @@
+import cfpq_data
+import networkx as nx
+import numpy as np
+import pytest
+
+from project.regex import graph as graph_module
+from project.regex.connected_vertices import tensor_based_rpq
+from project.regex.graph import load_graph
+from project.regex.graph_store import convert_csv, open_graph_store
+from project.regex.reachability import ms_bfs_based_rpq
+
+
+def write_csv(path, edges: list[tuple]) -> str:
+    path.write_text("".join(f"{u} {v} {label}\n" for u, v, label in edges))
+    return str(path)
+
+
+def edge_multiset(graph: nx.MultiDiGraph) -> list:
+    return sorted(map(str, graph.edges(data="label")))
+
+
+class TestGraphStore:
+    # Checking that a store maps the arrays of the CSV and gives the same
+    # networkx graph as cfpq_data.graph_from_csv
+    @pytest.mark.parametrize(
+        "edges",
+        [
+            [(0, 1, "a"), (1, 2, "b"), (2, 0, "a"), (1, 2, "b"), (5, 5, "c")],
+            [("x", "y", "a"), ("y", "z", "b"), ("z", "x", "a")],
+        ],
+    )
+    @pytest.mark.parametrize("mmap", [True, False])
+    def test_convert(self, tmp_path, edges: list[tuple], mmap: bool):
+        csv = write_csv(tmp_path / "graph.csv", edges)
+        convert_csv(csv, tmp_path / "graph.graph")
+
+        stored = open_graph_store(tmp_path / "graph.graph", mmap)
+        expected = cfpq_data.graph_from_csv(csv)
+
+        assert isinstance(stored.sources, np.memmap) == mmap
+        assert stored.number_of_nodes() == expected.number_of_nodes()
+        assert stored.number_of_edges() == expected.number_of_edges()
+        assert list(stored) == list(expected.nodes)
+        assert stored._networkx is None
+        assert edge_multiset(stored.to_networkx()) == edge_multiset(expected)
+
+    # Checking that queries run on the arrays without a networkx graph
+    def test_queries(self, tmp_path):
+        graph = cfpq_data.labeled_two_cycles_graph(5, 4, labels=("a", "b"))
+        csv = write_csv(tmp_path / "graph.csv", graph.edges(data="label"))
+        convert_csv(csv, tmp_path / "graph.graph")
+        stored = open_graph_store(tmp_path / "graph.graph")
+
+        for regex in ["a* b", "(a | b)* b b"]:
+            assert ms_bfs_based_rpq(regex, stored, {0, 1}) == ms_bfs_based_rpq(
+                regex, graph, {0, 1}
+            )
+            assert tensor_based_rpq(regex, stored, None, {2}) == tensor_based_rpq(
+                regex, graph, None, {2}
+            )
+        assert stored._networkx is None
+
+    # Checking that load_graph downloads a dataset only once
+    def test_load_graph(self, tmp_path, monkeypatch):
+        csv = write_csv(tmp_path / "wc.csv", [(0, 1, "a"), (1, 2, "d")])
+        downloads = []
+
+        def download(name: str) -> str:
+            downloads.append(name)
+            return csv
+
+        monkeypatch.setattr(graph_module.cfpq, "download", download)
+        first = load_graph("wc", tmp_path / "store")
+        second = load_graph("wc", tmp_path / "store")
+
+        assert downloads == ["wc"]
+        assert edge_multiset(first.to_networkx()) == edge_multiset(second.to_networkx())
+        assert second.number_of_edges() == 2
+
+    # Checking that a stored graph cannot be edited through the networkx
+    # API while a copy of its networkx graph can
+    def test_read_only(self, tmp_path):
+        csv = write_csv(tmp_path / "graph.csv", [(0, 1, "a"), (1, 2, "b")])
+        convert_csv(csv, tmp_path / "graph.graph")
+        stored = open_graph_store(tmp_path / "graph.graph")
+
+        with pytest.raises(nx.NetworkXError):
+            stored.add_edge(2, 0, label="a")
+        graph = nx.MultiDiGraph(stored.to_networkx())
+        graph.add_edge(2, 0, label="a")
+        assert stored.number_of_edges() == 2 and graph.number_of_edges() == 3
@@ -0,0 +1,34 @@
+import cfpq_data
+import pytest
+
+from project.regex.parallel_reachability import (
+    parallel_ms_bfs_based_rpq,
+    parallel_ms_bfs_based_rpq_arrays,
+)
+from project.regex.reachability import ms_bfs_based_rpq
+
+
+class TestParallelMsBfs:
+    # Checking that the merged answer of the workers equals the sequential one
+    @pytest.mark.parametrize("start_nodes", [None, {0, 3, 4, 8}, {42}])
+    def test_parallel_ms_bfs(self, start_nodes: set[int]):
+        graph = cfpq_data.labeled_two_cycles_graph(5, 4, labels=("a", "b"))
+        regex = "a* b (a | b)*"
+
+        parallel = parallel_ms_bfs_based_rpq(regex, graph, start_nodes, max_workers=2)
+
+        assert parallel == ms_bfs_based_rpq(regex, graph, start_nodes)
+
+    # Checking chunks of single start nodes and a regex without shared labels
+    def test_small_chunks(self):
+        graph = cfpq_data.labeled_two_cycles_graph(5, 4, labels=("a", "b"))
+
+        starts, finals = parallel_ms_bfs_based_rpq_arrays(
+            "a a", graph, max_workers=2, chunk_size=1
+        )
+        unknown = parallel_ms_bfs_based_rpq("c", graph, max_workers=2)
+
+        assert set(zip(starts.tolist(), finals.tolist())) == ms_bfs_based_rpq(
+            "a a", graph
+        )
+        assert unknown == set()
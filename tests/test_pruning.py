@@ -0,0 +1,74 @@
+import cfpq_data
+import networkx as nx
+import pytest
+from pyformlang.cfg import CFG
+
+from project.cfg.gll import gll_based_cfpq
+from project.cfg.hellings import hellings_based_cfpq
+from project.cfg.matrix import matrix_based_cfpq
+from project.cfg.rsm import cfg_to_rsm
+from project.cfg.tensor import tensor_based_cfpq
+from project.regex.connected_vertices import tensor_based_rpq
+from project.regex.pruning import prune_graph
+from project.regex.reachability import ms_bfs_based_rpq, ms_bfs_based_rpq_arrays
+
+
+# Two cycles over a and b with a tail of c edges and a node that is not
+# reachable from anywhere
+def sample_graph() -> nx.MultiDiGraph:
+    graph = cfpq_data.labeled_two_cycles_graph(3, 2, labels=("a", "b"))
+    graph.add_edge(0, 10, label="c")
+    graph.add_edge(10, 11, label="c")
+    graph.add_edge(12, 1, label="a")
+    return graph
+
+
+class TestPruning:
+    # Checking that irrelevant labels and nodes off the start-final paths
+    # are dropped and the rest is renumbered compactly
+    def test_prune_graph(self):
+        pruned = prune_graph(sample_graph(), {"a"}, {1}, {2})
+
+        assert sorted(pruned.nodes.tolist()) == [0, 1, 2, 3]
+        assert set(pruned.graph.nodes) == {0, 1, 2, 3}
+        assert {label for _, _, label in pruned.graph.edges(data="label")} == {"a"}
+        assert pruned.start_nodes == {pruned.nodes.tolist().index(1)}
+        assert not pruned.empty
+
+    # Checking that both RPQ engines give the same answer with pruning
+    @pytest.mark.parametrize("rpq", [tensor_based_rpq, ms_bfs_based_rpq])
+    @pytest.mark.parametrize(
+        "start_nodes, final_nodes", [(None, None), ({0, 12}, {2, 4}), ({11}, {0})]
+    )
+    def test_rpq(self, rpq, start_nodes: set[int], final_nodes: set[int]):
+        graph = sample_graph()
+        regex = "a* (b | c)"
+
+        assert rpq(regex, graph, start_nodes, final_nodes, prune=True) == rpq(
+            regex, graph, start_nodes, final_nodes
+        )
+
+    # Checking that the arrays answer is mapped back to the original nodes
+    def test_rpq_arrays(self):
+        starts, finals = ms_bfs_based_rpq_arrays("c c", sample_graph(), prune=True)
+
+        assert list(zip(starts.tolist(), finals.tolist())) == [(0, 11)]
+
+    # Checking that all CFPQ engines give the same answer with pruning
+    @pytest.mark.parametrize(
+        "cfpq, to_query",
+        [
+            (hellings_based_cfpq, lambda cfg: cfg),
+            (matrix_based_cfpq, lambda cfg: cfg),
+            (tensor_based_cfpq, cfg_to_rsm),
+            (gll_based_cfpq, cfg_to_rsm),
+        ],
+    )
+    @pytest.mark.parametrize("start_nodes", [set(), {0, 12}])
+    def test_cfpq(self, cfpq, to_query, start_nodes: set[int]):
+        graph = sample_graph()
+        query = to_query(CFG.from_text("S -> a S b | a b | $"))
+
+        assert cfpq(query, graph, start_nodes, set(), prune=True) == cfpq(
+            query, graph, start_nodes, set()
+        )
@@ -0,0 +1,63 @@
+from project.regex.create_finite_automaton import (
+    _compile_dfa,
+    _compile_table,
+    regex_cache,
+    regex_to_dfa,
+)
+from project.regex.glushkov import compile_regex
+from project.regex.regex_cache import RegexCache, normalize_regex
+
+
+KIND = "pyformlang_dfa"
+
+
+class TestRegexCache:
+    # Checking that spacing variants of one regex share a cache entry
+    def test_normalize_regex(self):
+        assert normalize_regex("  a   b |  c * ") == "a b|c*"
+        assert normalize_regex("a ( b )") == normalize_regex("a(b)")
+        assert normalize_regex("a b") != normalize_regex("ab")
+
+    # Checking hits, misses and LRU eviction
+    def test_lru(self):
+        cache = RegexCache(maxsize=2)
+
+        cache.get("a b*", _compile_table, KIND)
+        cache.get("a  b*", _compile_table, KIND)
+        cache.get("c", _compile_table, KIND)
+        cache.get("d", _compile_table, KIND)
+        cache.get("c", _compile_table, KIND)
+        cache.get("a b*", _compile_table, KIND)
+
+        info = cache.cache_info()
+        assert (info.hits, info.misses, info.currsize) == (2, 4, 2)
+
+    # Checking that a new process can reuse compiled regexes from disk
+    def test_disk_store(self, tmp_path):
+        regex = "(a | b)* c"
+        RegexCache(directory=tmp_path).get(regex, _compile_table, KIND)
+
+        def fail(regex: str):
+            raise AssertionError(f"{regex} is compiled again")
+
+        cache = RegexCache(directory=tmp_path)
+        dfa = cache.get(regex, fail, KIND).to_dfa()
+
+        assert cache.cache_info().disk_hits == 1
+        assert dfa.is_equivalent_to(_compile_dfa(regex))
+        assert dfa.accepts("abbac")
+        assert not dfa.accepts("ab")
+
+    # Checking that the pyformlang and the native pipelines never get
+    # tables compiled by each other
+    def test_pipelines(self):
+        regex_cache.cache_clear()
+
+        regex_to_dfa("x (y | z)*")
+        compile_regex("x (y | z)*", "dfa")
+        compile_regex("x (y | z)*", "auto")
+        assert regex_cache.cache_info().misses == 3
+
+        regex_to_dfa("x (y | z)*")
+        compile_regex("x (y | z)*", "dfa")
+        assert regex_cache.cache_info()[:3] == (2, 0, 3)
@@ -0,0 +1,66 @@
+import logging
+
+import cfpq_data
+import pytest
+
+from project.regex import rpq as rpq_module
+from project.regex.connected_vertices import tensor_based_rpq
+from project.regex.reachability import ms_bfs_based_rpq
+from project.regex.rpq import RPQEngine, choose_engine, query_stats, rpq
+
+
+class TestRPQ:
+    # Checking that the chosen engine gives the same answer and is logged
+    @pytest.mark.parametrize("start_nodes", [None, {0, 4}])
+    def test_auto(self, caplog, start_nodes: set[int]):
+        graph = cfpq_data.labeled_two_cycles_graph(4, 3, labels=("a", "b"))
+        regex = "a* b | b a"
+
+        with caplog.at_level(logging.INFO, logger="project.regex.rpq"):
+            answer = rpq(regex, graph, start_nodes)
+
+        assert answer == tensor_based_rpq(regex, graph, start_nodes)
+        assert answer == ms_bfs_based_rpq(regex, graph, start_nodes)
+        assert "RPQ engine" in caplog.text
+
+    # Checking the estimates: all pairs over long cycles need as many BFS
+    # levels as nodes, so the closure wins, while a shallow scale-free
+    # graph is cheaper for ms-BFS
+    def test_choose_engine(self):
+        cycles = cfpq_data.labeled_two_cycles_graph(1000, 500, labels=("a", "b"))
+        scale_free = cfpq_data.labeled_scale_free_graph(
+            2000, labels=["a", "b", "c"], seed=1
+        )
+
+        assert choose_engine(query_stats("a* b*", cycles))[0] == "tensor"
+        assert choose_engine(query_stats("a (b | c)*", scale_free))[0] == "ms_bfs"
+
+    # Checking that a registered engine takes part in the choice and that
+    # unknown engines are rejected
+    def test_register_engine(self, monkeypatch):
+        graph = cfpq_data.labeled_two_cycles_graph(4, 3, labels=("a", "b"))
+        monkeypatch.setitem(
+            rpq_module.RPQ_ENGINES,
+            "constant",
+            RPQEngine(lambda *args, **options: {(0, 0)}, lambda stats: 0.0),
+        )
+
+        assert rpq("a", graph) == {(0, 0)}
+        assert rpq("a", graph, engine="ms_bfs") == ms_bfs_based_rpq("a", graph)
+        with pytest.raises(ValueError):
+            rpq("a", graph, engine="magic")
+
+    # Checking that options reach only the engines that take them, that
+    # options no engine takes are rejected and that the process pool is
+    # never chosen by the cost models
+    def test_options(self):
+        graph = cfpq_data.labeled_two_cycles_graph(4, 3, labels=("a", "b"))
+        expected = ms_bfs_based_rpq("a b", graph)
+
+        assert rpq("a b", graph, prune=True, regex_mode="glushkov") == expected
+        assert rpq("a b", graph, engine="ms_bfs", prune=True) == expected
+        with pytest.raises(ValueError, match="max_workers"):
+            rpq("a b", graph, max_workers=2)
+        with pytest.raises(ValueError, match="chunk_size"):
+            rpq("a b", graph, engine="ms_bfs", chunk_size=2)
+        assert "parallel_ms_bfs" not in choose_engine(query_stats("a b", graph))[1]